@@ -1,7 +1,20 @@
+import importlib
+
 from fastapi import APIRouter
 
-from app.api.endpoints import users, items
+from app.api.endpoints import profiler
+from app.config import settings
+
+
+def endpoint_router(name: str) -> APIRouter:
+    # Each router can be switched to its async implementation independently;
+    # only the implementation in use is imported
+    suffix = "_async" if name in settings.ASYNC_ROUTERS else ""
+    return importlib.import_module(f"app.api.endpoints.{name}{suffix}").router
+
 
 api_router = APIRouter()
-api_router.include_router(users.router, prefix="/users", tags=["users"])
-api_router.include_router(items.router, prefix="/items", tags=["items"])
+api_router.include_router(endpoint_router("users"), prefix="/users", tags=["users"])
+api_router.include_router(endpoint_router("items"), prefix="/items", tags=["items"])
+if settings.PROFILER_ENABLED:
+    api_router.include_router(profiler.router, prefix="/profiler", tags=["profiler"])
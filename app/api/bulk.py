@@ -0,0 +1,95 @@
+from collections import Counter
+from typing import AbstractSet, Annotated, Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+from fastapi import Body, HTTPException, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response
+
+from app import models, schemas
+from app.config import settings
+
+# Bulk request bodies. The length is checked while the list is validated,
+# so an oversized batch fails before its entries become models.
+ItemCreateBatch = Annotated[List[schemas.ItemCreate], Body(max_length=settings.BULK_MAX_BATCH_SIZE)]
+ItemUpdateBatch = Annotated[List[schemas.ItemBulkUpdate], Body(max_length=settings.BULK_MAX_BATCH_SIZE)]
+IdBatch = Annotated[List[int], Body(max_length=settings.BULK_MAX_BATCH_SIZE)]
+
+
+async def validation_exception_handler(request: Request, exc: RequestValidationError) -> Response:
+    """
+    413 for a bulk body over BULK_MAX_BATCH_SIZE, instead of a 422 that
+    would echo the whole list back; other validation errors as usual.
+    """
+    if any(error["type"] == "too_long" and tuple(error["loc"]) == ("body",) for error in exc.errors()):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"At most {settings.BULK_MAX_BATCH_SIZE} items per bulk request"},
+        )
+    return await request_validation_exception_handler(request, exc)
+
+
+def item_updates(
+    items_in: Sequence[schemas.ItemBulkUpdate],
+) -> Tuple[Dict[int, Dict[str, Any]], Set[int]]:
+    """
+    Changed fields per id, and the ids of entries that change nothing.
+
+    An id may appear only once (else 422): several entries for one item
+    would have to be merged, and silently picking one loses the others.
+    """
+    counts = Counter(item_in.id for item_in in items_in)
+    duplicates = sorted(id for id, count in counts.items() if count > 1)
+    if duplicates:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Each id may appear once per bulk update, repeated: {duplicates}",
+        )
+    updates = {}
+    empty = set()
+    for item_in in items_in:
+        fields = item_in.model_dump(exclude={"id"}, exclude_none=True)
+        if fields:
+            updates[item_in.id] = fields
+        else:
+            empty.add(item_in.id)
+    return updates, empty
+
+
+def missing_ids(requested: Iterable[int], changed: Sequence[models.Item]) -> List[int]:
+    done = {item.id for item in changed}
+    return [id for id in requested if id not in done]
+
+
+def bulk_results(
+    requested: Iterable[int],
+    changed: Sequence[models.Item],
+    existing: Set[int],
+    status: int = 200,
+    empty: AbstractSet[int] = frozenset(),
+) -> List[schemas.BulkItemResult]:
+    """
+    Per-item results in request order; ``empty`` entries, which were not
+    written, are 400; ids that were not changed are 403 if the row exists
+    (so ownership filtered it out) and 404 otherwise.
+    """
+    by_id = {item.id: item for item in changed}
+    results = []
+    for id in requested:
+        if id in empty:
+            results.append(schemas.BulkItemResult(
+                id=id, status=400, detail="Nothing to update"
+            ))
+        elif id in by_id:
+            results.append(schemas.BulkItemResult(
+                id=id, status=status, item=schemas.Item.model_validate(by_id[id])
+            ))
+        elif id in existing:
+            results.append(schemas.BulkItemResult(
+                id=id, status=403, detail="Not enough permissions"
+            ))
+        else:
+            results.append(schemas.BulkItemResult(
+                id=id, status=404, detail="Item not found"
+            ))
+    return results
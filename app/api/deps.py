@@ -1,7 +1,33 @@
 from fastapi import Depends
 from sqlalchemy.orm import Session
 
-from app.dependencies import get_db, get_current_user, get_current_active_user, get_current_active_superuser
+from app.dependencies import (
+    get_db,
+    get_read_db,
+    get_async_db,
+    get_async_read_db,
+    get_current_user,
+    get_current_active_user,
+    get_current_active_superuser,
+    get_current_active_user_row,
+    get_current_user_async,
+    get_current_active_user_async,
+    get_current_active_superuser_async,
+    get_current_active_user_row_async,
+)
 
 # Re-export dependencies for simplicity
-__all__ = ["get_db", "get_current_user", "get_current_active_user", "get_current_active_superuser"]
+__all__ = [
+    "get_db",
+    "get_read_db",
+    "get_async_db",
+    "get_async_read_db",
+    "get_current_user",
+    "get_current_active_user",
+    "get_current_active_superuser",
+    "get_current_active_user_row",
+    "get_current_user_async",
+    "get_current_active_user_async",
+    "get_current_active_superuser_async",
+    "get_current_active_user_row_async",
+]
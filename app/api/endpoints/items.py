@@ -1,37 +1,97 @@
-from typing import Any, List
+from typing import Any, List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
 
-from app import models, schemas
-from app.api import deps
+from app import counts, crud, etags, models, schemas, search, serialization, shared_cache
+from app.api import bulk, deps, export
+from app.pagination import NEXT_CURSOR_HEADER, SortKey, next_cursor, paginate
 
 router = APIRouter()
 
 
+def _check_visible(item: Any, current_user: models.User) -> None:
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not current_user.is_superuser and (item.owner_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+
+def _get_visible_item(db: Session, id: int, current_user: models.User) -> models.Item:
+    item = db.query(models.Item).filter(models.Item.id == id).first()
+    _check_visible(item, current_user)
+    return item
+
+
+def _load_item_body(db: Session, id: int) -> Optional[bytes]:
+    item = db.get(models.Item, id)
+    return serialization.encode_models(serialization.item, item) if item else None
+
+
+def _write_error(
+    db: Session, id: int, current_user: models.User, version: List[Any]
+) -> HTTPException:
+    """
+    Why a single-item UPDATE/DELETE matched nothing: a stale If-Match
+    version (412), a missing item (404) or someone else's (403).
+    """
+    ownership = crud.item.ownership_criteria(current_user)
+    if version and crud.item.existing_ids(db, ids=[id], criteria=ownership):
+        return etags.precondition_failed()
+    if current_user.is_superuser or not crud.item.existing_ids(db, ids=[id]):
+        return HTTPException(status_code=404, detail="Item not found")
+    return HTTPException(status_code=403, detail="Not enough permissions")
+
+
 @router.get("/", response_model=List[schemas.Item])
 def read_items(
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    order_by: SortKey = "id",
+    include: Optional[Literal["owner"]] = None,
+    total: Optional[counts.TotalMode] = None,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    next page; `skip` still works but gets slower the deeper it goes.
+    With `include=owner` every item carries its owner, joined in the same query.
+    `total=exact|estimate` adds the number of visible items as `X-Total-Count`.
+    Sends an `ETag` for the page; a matching `If-None-Match` gets 304.
     """
-    # If user is superuser, return all items
-    if current_user.is_superuser:
-        items = db.query(models.Item).offset(skip).limit(limit).all()
+    fast = serialization.items
+    if include == "owner":
+        query = select(models.Item).options(joinedload(models.Item.owner))
     else:
-        # Otherwise, return only the user's items
-        items = (
-            db.query(models.Item)
-            .filter(models.Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
-    return items
+        query = fast.select()
+    # Superusers see all items, everyone else only their own
+    if not current_user.is_superuser:
+        query = query.filter(models.Item.owner_id == current_user.id)
+    result = db.execute(paginate(
+        query, models.Item, order_by=order_by, cursor=cursor, skip=skip, limit=limit
+    ))
+    items = result.scalars().all() if include else fast.fetch(result)
+    next_page = next_cursor(items, limit, order_by)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
+    related = [item.owner for item in items if item.owner] if include else []
+    not_modified = etags.not_modified(request, response, etags.collection_etag([*items, *related]))
+    if not_modified:
+        return not_modified
+    if total:
+        count = counts.items.total(db, current_user, total)
+        response.headers[counts.TOTAL_COUNT_HEADER] = str(count)
+    if include == "owner":
+        return serialization.render_models(serialization.items_with_owner, items, response)
+    return fast.render(items, response)
 
 
 @router.post("/", response_model=schemas.Item)
@@ -44,61 +104,185 @@ def create_item(
     """
     Create new item.
     """
-    item = models.Item(
-        title=item_in.title,
-        description=item_in.description,
-        owner_id=current_user.id
-    )
-    db.add(item)
-    db.commit()
-    db.refresh(item)
+    # INSERT ... RETURNING: the generated id and defaults come back with the write
+    item = crud.item.create(db, obj_in=item_in, values={"owner_id": current_user.id})
+    counts.items.adjust(current_user.id, 1)
+    shared_cache.cache.invalidate(*shared_cache.item_keys([item]))
     return item
 
 
+@router.post("/bulk", response_model=List[schemas.BulkItemResult], status_code=201)
+def create_items_bulk(
+    *,
+    db: Session = Depends(deps.get_db),
+    items_in: bulk.ItemCreateBatch,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Create many items with one multi-row INSERT.
+    """
+    if not items_in:
+        return []
+    items = crud.item.create_multi(
+        db, objs_in=items_in, values={"owner_id": current_user.id}
+    )
+    counts.items.adjust(current_user.id, len(items))
+    shared_cache.cache.invalidate(*shared_cache.item_keys(items))
+    return bulk.bulk_results([item.id for item in items], items, set(), status=201)
+
+
+@router.patch("/bulk", response_model=List[schemas.BulkItemResult])
+def update_items_bulk(
+    *,
+    db: Session = Depends(deps.get_db),
+    items_in: bulk.ItemUpdateBatch,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Update many items with one UPDATE; each entry gets its own status.
+    """
+    updates, empty = bulk.item_updates(items_in)
+    items = []
+    if updates:
+        items = crud.item.update_multi(
+            db, updates=updates, criteria=crud.item.ownership_criteria(current_user)
+        )
+    missing = bulk.missing_ids(updates, items)
+    existing = crud.item.existing_ids(db, ids=missing) if missing else set()
+    shared_cache.cache.invalidate(*shared_cache.item_keys(items))
+    return bulk.bulk_results([item_in.id for item_in in items_in], items, existing, empty=empty)
+
+
+@router.delete("/bulk", response_model=List[schemas.BulkItemResult])
+def delete_items_bulk(
+    *,
+    db: Session = Depends(deps.get_db),
+    ids: bulk.IdBatch,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Delete many items with one DELETE; each id gets its own status.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    items = crud.item.remove_multi(
+        db, ids=ids, criteria=crud.item.ownership_criteria(current_user)
+    )
+    for item in items:
+        counts.items.adjust(item.owner_id, -1)
+    shared_cache.cache.invalidate(*shared_cache.item_keys(items))
+    missing = bulk.missing_ids(ids, items)
+    existing = crud.item.existing_ids(db, ids=missing) if missing else set()
+    return bulk.bulk_results(ids, items, existing)
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_items(
+    format: export.ExportFormat = "ndjson",
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Stream items as NDJSON or CSV, with the same visibility as `read_items`.
+    """
+    stmt = export.export_stmt(
+        models.Item, models.Item.__table__.columns,
+        *crud.item.ownership_criteria(current_user),
+    )
+    return export.export_response(export.iter_export(stmt, format), "items", format)
+
+
+@router.get("/search", response_model=List[schemas.Item])
+def search_items(
+    db: Session = Depends(deps.get_read_db),
+    q: str = Query(..., min_length=1, max_length=200),
+    mode: search.SearchMode = "text",
+    skip: int = 0,
+    limit: int = Query(20, le=100),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Search items, best matches first, with the same visibility as `read_items`.
+
+    `mode=text` ranks full-text matches over title and description;
+    `mode=prefix` matches title words starting with `q` (autocomplete).
+    """
+    if not q.split():
+        return []
+    stmt = search.search_items_stmt(
+        db.get_bind().dialect.name, q, mode, *crud.item.ownership_criteria(current_user)
+    )
+    return db.scalars(stmt.offset(skip).limit(limit)).all()
+
+
 @router.put("/{id}", response_model=schemas.Item)
 def update_item(
     *,
     db: Session = Depends(deps.get_db),
+    response: Response,
     id: int,
     item_in: schemas.ItemUpdate,
+    if_match: Optional[str] = Header(None),
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Update an item.
+
+    With `If-Match: <ETag>` the update only applies if the item has not
+    changed since that version was read, otherwise 412.
     """
-    item = db.query(models.Item).filter(models.Item.id == id).first()
+    update_data = crud.item.update_data(item_in, exclude_none=True)
+    if not update_data:
+        item = _get_visible_item(db, id, current_user)
+        etag = etags.entity_etag(item)
+        if if_match is not None and not etags.matches(if_match, etag):
+            raise etags.precondition_failed()
+        response.headers["ETag"] = etag
+        return item
+
+    # One UPDATE ... RETURNING with the ownership and version checks in the WHERE clause
+    version = etags.version_criteria(models.Item, id, if_match)
+    item = crud.item.update_by_id(
+        db, id=id, obj_in=update_data,
+        criteria=[*crud.item.ownership_criteria(current_user), *version],
+    )
     if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    # Update item with new data
-    if item_in.title is not None:
-        item.title = item_in.title
-    if item_in.description is not None:
-        item.description = item_in.description
-    
-    db.add(item)
-    db.commit()
-    db.refresh(item)
+        raise _write_error(db, id, current_user, version)
+    shared_cache.cache.invalidate(*shared_cache.item_keys([item]))
+    response.headers["ETag"] = etags.entity_etag(item)
     return item
 
 
 @router.get("/{id}", response_model=schemas.Item)
 def read_item(
     *,
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Get item by ID.
+
+    Sends an `ETag`; a matching `If-None-Match` gets 304 without a body.
+    Served from the shared cache when CACHE_BACKEND is set.
     """
-    item = db.query(models.Item).filter(models.Item.id == id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=403, detail="Not enough permissions")
+    body = None
+    if shared_cache.cache.enabled:
+        # The cached JSON is served as is; it is decoded for the checks only
+        body = shared_cache.cache.get_or_load(
+            shared_cache.item_key(id), lambda: _load_item_body(db, id)
+        )
+        item = serialization.item.validate_json(body) if body else None
+    else:
+        item = db.query(models.Item).filter(models.Item.id == id).first()
+    _check_visible(item, current_user)
+    not_modified = etags.not_modified(request, response, etags.entity_etag(item))
+    if not_modified:
+        return not_modified
+    if body:
+        return serialization.json_body(body, response)
     return item
 
 
@@ -107,16 +291,20 @@ def delete_item(
     *,
     db: Session = Depends(deps.get_db),
     id: int,
+    if_match: Optional[str] = Header(None),
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Delete an item.
+    Delete an item; with `If-Match: <ETag>` only that version of it (else 412).
     """
-    item = db.query(models.Item).filter(models.Item.id == id).first()
+    # One DELETE ... RETURNING with the ownership and version checks in the WHERE clause
+    version = etags.version_criteria(models.Item, id, if_match)
+    item = crud.item.remove(
+        db, id=id, criteria=[*crud.item.ownership_criteria(current_user), *version]
+    )
     if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    db.delete(item)
-    db.commit()
+        raise _write_error(db, id, current_user, version)
+    counts.items.adjust(item.owner_id, -1)
+    shared_cache.cache.invalidate(*shared_cache.item_keys([item]))
     return item
+
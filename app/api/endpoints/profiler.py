@@ -0,0 +1,42 @@
+import os
+from typing import Any, Literal, Optional
+
+from fastapi import APIRouter, Depends, Response
+from fastapi.responses import PlainTextResponse
+
+from app.api import deps
+from app.dependencies import CurrentUser
+from app.profiler import collapsed, profiler
+
+router = APIRouter()
+
+
+@router.get("/stacks")
+async def read_stacks(
+    route: Optional[str] = None,
+    format: Literal["collapsed", "json"] = "collapsed",
+    current_user: CurrentUser = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Sampled stacks of profiled requests, per route (e.g. `GET /api/v1/items/`).
+    Only for superusers.
+
+    `format=collapsed` is flamegraph.pl / speedscope input, one
+    `route;frame;...;frame count` line per stack. The numbers are this
+    worker process's; under several workers each request sees one of them.
+    """
+    routes = profiler.snapshot(route)
+    if format == "json":
+        return {"pid": os.getpid(), "routes": routes}
+    return PlainTextResponse(collapsed(routes))
+
+
+@router.delete("/stacks", status_code=204)
+async def reset_stacks(
+    current_user: CurrentUser = Depends(deps.get_current_active_superuser),
+) -> Response:
+    """
+    Drop this worker process's stacks. Only for superusers.
+    """
+    profiler.reset()
+    return Response(status_code=204)
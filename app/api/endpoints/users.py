@@ -1,18 +1,49 @@
 from datetime import timedelta
-from typing import Any, List
+from typing import Any, List, Literal, Optional
 
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 
-from app import schemas, models
-from app.api import deps
-from app.auth import create_access_token, get_password_hash, verify_password
+from app import counts, crud, etags, schemas, models, serialization, shared_cache
+from app.api import deps, export
+from app.auth import (
+    client_ip,
+    create_access_token,
+    dummy_password_hash,
+    get_password_hash,
+    invalidate_user_auth,
+    login_limiter,
+    revoke_user_tokens,
+    token_versions,
+    user_claims,
+    verify_and_update_password,
+)
 from app.config import settings
+from app.hashing import hash_executor
+from app.pagination import NEXT_CURSOR_HEADER, SortKey, next_cursor, paginate
 
 router = APIRouter()
 
 
+def _load_user(db: Session, user_id: int, include: Optional[str]) -> Optional[models.User]:
+    query = db.query(models.User).filter(models.User.id == user_id)
+    if include == "items":
+        # One SELECT ... WHERE owner_id IN (...) for the items, never a lazy load
+        query = query.options(selectinload(models.User.items))
+    return query.first()
+
+
+def _load_user_body(db: Session, user_id: int, include: Optional[str]) -> Optional[bytes]:
+    user = _load_user(db, user_id, include)
+    if not user:
+        return None
+    adapter = serialization.user_with_items if include == "items" else serialization.user
+    return serialization.encode_models(adapter, user)
+
+
 @router.post("/", response_model=schemas.User)
 def create_user(
     *,
@@ -39,7 +70,7 @@ def create_user(
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = hash_executor.run(get_password_hash, user_in.password)
     db_user = models.User(
         email=user_in.email,
         username=user_in.username,
@@ -47,38 +78,56 @@ def create_user(
         is_active=user_in.is_active,
         is_superuser=user_in.is_superuser,
     )
+    # The INSERT returns the generated id; no refresh SELECT is needed
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    counts.users.adjust(None, 1)
     return db_user
 
 
 @router.post("/login/access-token", response_model=schemas.Token)
 def login_access_token(
+    request: Request,
     db: Session = Depends(deps.get_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    # Try to find user by username
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    
-    # If not found, try by email
-    if not user:
-        user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    
-    # Validate user credentials
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    ip = client_ip(request)
+    # Refuse bursts of failures before paying for a lookup and a hash
+    login_limiter.check(form_data.username, ip)
+
+    # One lookup by username or email
+    user = db.scalars(crud.user.login_stmt(form_data.username)).first()
+    hashed_password = user.hashed_password if user else dummy_password_hash()
+    valid, new_hash = hash_executor.run(
+        verify_and_update_password, form_data.password, hashed_password
+    )
+
+    # Unknown users are checked against a dummy hash, so they take as long
+    # as wrong passwords
+    if not user or not valid:
+        login_limiter.record_failure(form_data.username, ip)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    login_limiter.reset(form_data.username)
+
+    if new_hash:
+        # Made with an older scheme or cost; migrate while we have the password
+        user.hashed_password = new_hash
+        db.commit()
+        # updated_at moved, so cached copies carry a stale ETag
+        shared_cache.cache.invalidate_prefix(shared_cache.user_prefix(user.id))
     
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    if settings.AUTH_STATELESS:
+        token_versions.set(user.id, user.token_version)
     return {
         "access_token": create_access_token(
-            user.id, expires_delta=access_token_expires
+            user.id, expires_delta=access_token_expires, claims=user_claims(user)
         ),
         "token_type": "bearer",
     }
@@ -86,35 +135,77 @@ def login_access_token(
 
 @router.get("/me", response_model=schemas.User)
 def read_users_me(
-    current_user: models.User = Depends(deps.get_current_active_user),
+    request: Request,
+    response: Response,
+    current_user: models.User = Depends(deps.get_current_active_user_row),
 ) -> Any:
     """
-    Get current user.
+    Get current user; a matching `If-None-Match` gets 304 without a body.
     """
+    not_modified = etags.not_modified(request, response, etags.entity_etag(current_user))
+    if not_modified:
+        return not_modified
     return current_user
 
 
+@router.get("/export", response_class=StreamingResponse)
+def export_users(
+    format: export.ExportFormat = "ndjson",
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Stream all users as NDJSON or CSV. Only for superusers.
+    """
+    stmt = export.export_stmt(models.User, serialization.USER_COLUMNS)
+    return export.export_response(export.iter_export(stmt, format), "users", format)
+
+
 @router.get("/{user_id}", response_model=schemas.User)
 def read_user_by_id(
+    request: Request,
+    response: Response,
     user_id: int,
+    include: Optional[Literal["items"]] = None,
     current_user: models.User = Depends(deps.get_current_active_user),
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_read_db),
 ) -> Any:
     """
-    Get a specific user by id.
+    Get a specific user by id; `include=items` adds the user's items.
+
+    Sends an `ETag`; a matching `If-None-Match` gets 304 without a body.
+    Served from the shared cache when CACHE_BACKEND is set.
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
-        raise HTTPException(
-            status_code=400, detail="The user doesn't have enough privileges"
-        )
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this id does not exist in the system",
+    adapter = serialization.user_with_items if include == "items" else serialization.user
+    body = None
+    if shared_cache.cache.enabled:
+        body = shared_cache.cache.get_or_load(
+            shared_cache.user_key(user_id, include),
+            lambda: _load_user_body(db, user_id, include),
         )
+        user = adapter.validate_json(body) if body else None
+    else:
+        user = _load_user(db, user_id, include)
+    if not (user and user.id == current_user.id):
+        if not current_user.is_superuser:
+            raise HTTPException(
+                status_code=400, detail="The user doesn't have enough privileges"
+            )
+        if not user:
+            raise HTTPException(
+                status_code=404,
+                detail="The user with this id does not exist in the system",
+            )
+    if include == "items":
+        etag = etags.collection_etag([user, *user.items])
+    else:
+        etag = etags.entity_etag(user)
+    not_modified = etags.not_modified(request, response, etag)
+    if not_modified:
+        return not_modified
+    if body:
+        return serialization.json_body(body, response)
+    if include == "items":
+        return serialization.render_models(serialization.user_with_items, user, response)
     return user
 
 
@@ -122,62 +213,127 @@ def read_user_by_id(
 def update_user_me(
     *,
     db: Session = Depends(deps.get_db),
+    response: Response,
     password: str = Body(None),
     email: str = Body(None),
     username: str = Body(None),
+    if_match: Optional[str] = Header(None),
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Update own user.
+    Update own user; with `If-Match: <ETag>` only if unchanged since then (else 412).
     """
-    current_user_data = {k: v for k, v in vars(current_user).items() if not k.startswith('_')}
-    user_in = schemas.UserUpdate(**current_user_data)
-    
-    if password is not None:
-        user_in.password = password
-    if email is not None:
-        user_in.email = email
-    if username is not None:
-        user_in.username = username
-    
-    # Update user with new data
-    if user_in.password:
-        hashed_password = get_password_hash(user_in.password)
-        current_user.hashed_password = hashed_password
-    if user_in.email:
-        # Check if email is taken
-        user = db.query(models.User).filter(models.User.email == user_in.email).first()
-        if user and user.id != current_user.id:
+    # Read once: a rollback below would expire the row and reload it
+    user_id = current_user.id
+    update_data = {}
+    if password:
+        update_data["hashed_password"] = hash_executor.run(get_password_hash, password)
+    if email:
+        update_data["email"] = email
+    if username:
+        update_data["username"] = username
+    if not update_data:
+        user = db.get(models.User, user_id)
+        etag = etags.entity_etag(user)
+        if if_match is not None and not etags.matches(if_match, etag):
+            raise etags.precondition_failed()
+        response.headers["ETag"] = etag
+        return user
+
+    # One UPDATE ... RETURNING; the unique indexes on email/username do the
+    # "already registered" checks, which only run again to word the error
+    try:
+        version = etags.version_criteria(models.User, user_id, if_match)
+        user = crud.user.update_by_id(db, id=user_id, obj_in=update_data, criteria=version)
+    except IntegrityError:
+        db.rollback()
+        taken = db.query(models.User).filter(models.User.id != user_id)
+        if email and taken.filter(models.User.email == email).first():
             raise HTTPException(
                 status_code=400,
                 detail="Email already registered",
             )
-        current_user.email = user_in.email
-    if user_in.username:
-        # Check if username is taken
-        user = db.query(models.User).filter(models.User.username == user_in.username).first()
-        if user and user.id != current_user.id:
+        if username and taken.filter(models.User.username == username).first():
             raise HTTPException(
                 status_code=400,
                 detail="Username already registered",
             )
-        current_user.username = user_in.username
-    
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+        raise
+    if not user:
+        # The version check is the only way the signed-in user's row can miss
+        if version:
+            raise etags.precondition_failed()
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_auth(user_id)
+    shared_cache.cache.invalidate_prefix(shared_cache.user_prefix(user_id))
+    response.headers["ETag"] = etags.entity_etag(user)
+    return user
+
+
+@router.put("/{user_id}", response_model=schemas.User)
+def update_user(
+    *,
+    db: Session = Depends(deps.get_db),
+    response: Response,
+    user_id: int,
+    is_active: bool = Body(None),
+    is_superuser: bool = Body(None),
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+) -> Any:
+    """
+    Activate or deactivate a user, or grant or take superuser rights. Only
+    for superusers. Either change revokes the user's existing tokens.
+    """
+    user = db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this id does not exist in the system",
+        )
+    changes = {"is_active": is_active, "is_superuser": is_superuser}
+    changes = {k: v for k, v in changes.items() if v is not None and v != getattr(user, k)}
+    if changes:
+        for field, value in changes.items():
+            setattr(user, field, value)
+        # Tokens carry is_active/is_superuser claims from before the change
+        revoke_user_tokens(user)
+        db.commit()
+        invalidate_user_auth(user_id)
+        shared_cache.cache.invalidate_prefix(shared_cache.user_prefix(user_id))
+    response.headers["ETag"] = etags.entity_etag(user)
+    return user
 
 
 @router.get("/", response_model=List[schemas.User])
 def read_users(
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    order_by: SortKey = "id",
+    total: Optional[counts.TotalMode] = None,
     current_user: models.User = Depends(deps.get_current_active_superuser),
 ) -> Any:
     """
     Retrieve users. Only for superusers.
+
+    `total=exact|estimate` adds the number of users as `X-Total-Count`.
+    Sends an `ETag` for the page; a matching `If-None-Match` gets 304.
     """
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+    fast = serialization.users
+    users = fast.fetch(db.execute(paginate(
+        fast.select(), models.User,
+        order_by=order_by, cursor=cursor, skip=skip, limit=limit,
+    )))
+    next_page = next_cursor(users, limit, order_by)
+    if next_page:
+        response.headers[NEXT_CURSOR_HEADER] = next_page
+    not_modified = etags.not_modified(request, response, etags.collection_etag(users))
+    if not_modified:
+        return not_modified
+    if total:
+        count = counts.users.total(db, current_user, total)
+        response.headers[counts.TOTAL_COUNT_HEADER] = str(count)
+    return fast.render(users, response)
@@ -0,0 +1,72 @@
+import csv
+import io
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, List, Literal, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app import database
+from app.config import settings
+from app.serialization import dumps
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_stmt(model: Any, columns: Sequence[Any], *criteria: Any) -> Any:
+    """
+    Core SELECT of plain columns (no ORM objects are built for exports).
+    """
+    return select(*columns).where(*criteria).order_by(model.id)
+
+
+def encode_rows(names: List[str], rows: Sequence[Any], format: ExportFormat) -> bytes:
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows
+        )
+        return buffer.getvalue().encode()
+    return b"".join(dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+
+def encode_header(names: List[str]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(names)
+    return buffer.getvalue().encode()
+
+
+def iter_export(stmt: Any, format: ExportFormat) -> Iterator[bytes]:
+    """
+    Stream ``stmt`` batch by batch from a server-side cursor.
+
+    The request's own session is closed before the body is sent, so the
+    export opens its own. Memory use is bounded by EXPORT_BATCH_SIZE rows.
+    """
+    names = [column.key for column in stmt.selected_columns]
+    if format == "csv":
+        yield encode_header(names)
+    with database.SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            yield encode_rows(names, rows, format)
+
+
+async def iter_export_async(stmt: Any, format: ExportFormat) -> AsyncIterator[bytes]:
+    names = [column.key for column in stmt.selected_columns]
+    if format == "csv":
+        yield encode_header(names)
+    async with database.AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield encode_rows(names, rows, format)
+
+
+def export_response(body: Any, name: str, format: ExportFormat) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
@@ -1,33 +1,255 @@
-from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+import hashlib
+import secrets
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from jose import jwt
+from fastapi import HTTPException, Request, status
 from passlib.context import CryptContext
 
+from app.cache import LRUTTLCache
 from app.config import settings
+from app.hashing import hash_executor
+from app.tokens import codec_from_settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Setting holding the passlib "rounds" of each rounds-based scheme
+HASH_ROUNDS_SETTINGS = {
+    "bcrypt": "BCRYPT_ROUNDS",
+    "argon2": "ARGON2_TIME_COST",
+    "scrypt": "SCRYPT_ROUNDS",
+}
 
-ALGORITHM = "HS256"
+
+def password_context(
+    schemes: Optional[List[str]] = None, rounds: Optional[Dict[str, int]] = None
+) -> CryptContext:
+    """
+    CryptContext for ``schemes`` (default PASSWORD_SCHEMES) with the cost
+    settings, or ``rounds`` overrides per scheme.
+
+    Every scheme but the first is deprecated, and rounds are pinned (min =
+    max = default), so needs_update() flags any hash made with another
+    scheme or cost, whether the cost was raised or lowered since.
+    """
+    schemes = list(schemes or settings.PASSWORD_SCHEMES)
+    rounds = rounds or {}
+    options: Dict[str, Any] = {}
+    for scheme in schemes:
+        setting = HASH_ROUNDS_SETTINGS.get(scheme)
+        if setting is None:
+            continue
+        value = rounds.get(scheme, getattr(settings, setting))
+        for key in ("default_rounds", "min_rounds", "max_rounds"):
+            options[f"{scheme}__{key}"] = value
+    if "argon2" in schemes:
+        options["argon2__memory_cost"] = settings.ARGON2_MEMORY_COST
+        options["argon2__parallelism"] = settings.ARGON2_PARALLELISM
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+pwd_context = password_context()
+
+# Signs new tokens with JWT_ACTIVE_KID, verifies tokens of every JWT_KEYS key
+token_codec = codec_from_settings()
 
 
 def create_access_token(
-    subject: Union[str, Any], expires_delta: Optional[timedelta] = None
+    subject: Union[str, Any],
+    expires_delta: Optional[timedelta] = None,
+    claims: Optional[Dict[str, Any]] = None,
 ) -> str:
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(
-            minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
-        )
-    to_encode = {"exp": expire, "sub": str(subject)}
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {"exp": int(time.time() + expires_delta.total_seconds()), "sub": str(subject)}
+    if claims:
+        to_encode.update(claims)
+    return token_codec.encode(to_encode)
+
+
+def user_claims(user: Any) -> Dict[str, Any]:
+    """
+    Claims that let the stateless auth mode skip the per-request user lookup.
+    """
+    return {
+        "is_active": bool(user.is_active),
+        "is_superuser": bool(user.is_superuser),
+        "ver": user.token_version or 0,
+    }
+
+
+class TokenCache(LRUTTLCache):
+    """
+    Decoded token payloads and the user resolved for them, keyed by a hash
+    of the bearer token. Entries never outlive the token's ``exp``.
+    """
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get_token(self, token: str) -> Optional[Tuple[Any, Any]]:
+        return self.get(self.key(token))
+
+    def set_token(self, token: str, token_data: Any, user: Any) -> None:
+        ttl = None
+        if token_data.exp is not None:
+            ttl = token_data.exp - time.time()
+        self.set(self.key(token), (token_data, user), ttl)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            stale = [k for k, (v, _) in self._data.items() if v[0].sub == user_id]
+            for k in stale:
+                del self._data[k]
+
+
+# user id -> current token version, consulted by the stateless auth mode
+token_versions = LRUTTLCache(
+    maxsize=settings.TOKEN_VERSION_CACHE_SIZE, ttl=settings.TOKEN_VERSION_TTL_SECONDS
+)
+token_cache = TokenCache(
+    maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_user_auth(user_id: int) -> None:
+    """
+    Drop cached auth state for a user; call after updating or deleting them.
+    """
+    token_versions.delete(user_id)
+    token_cache.invalidate_user(user_id)
+
+
+def revoke_user_tokens(user: Any) -> None:
+    """
+    Invalidate every token issued to ``user``, e.g. on deactivation.
+
+    Bumps the stored token version; the caller commits the change and then
+    calls invalidate_user_auth, so no cache holds a version the database
+    does not.
+    """
+    user.token_version = (user.token_version or 0) + 1
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    Client address for the per-IP login limit: from CLIENT_IP_HEADER when
+    the proxy sets one, else the socket peer.
+    """
+    if settings.CLIENT_IP_HEADER:
+        # Only the last hop was added by our proxy; earlier entries are
+        # whatever the client sent
+        forwarded = request.headers.get(settings.CLIENT_IP_HEADER, "").rpartition(",")[2].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else None
+
+
+class LoginLimiter:
+    """
+    Bounded in-process count of failed logins per identifier and per client IP.
+
+    Once either count reaches its limit within the window, further attempts
+    are refused with 429 before any user lookup or hashing, so credential
+    floods stop costing a bcrypt verification each. A limit of 0 disables
+    that key; a successful login clears the identifier's count.
+
+    Anyone who knows a username can lock that account out for the window
+    by failing on purpose; the identifier limit trades that for bounding
+    password guessing.
+    """
+
+    def __init__(self, maxsize: int, window: float, max_per_identifier: int, max_per_ip: int):
+        self.window = window
+        self.limits = {"login": max_per_identifier, "ip": max_per_ip}
+        self.failures = LRUTTLCache(maxsize=maxsize, ttl=window)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _keys(self, identifier: str, ip: Optional[str]) -> Tuple[Tuple[str, str], ...]:
+        keys = [("login", identifier.strip().lower())]
+        if ip:
+            keys.append(("ip", ip))
+        return tuple(key for key in keys if self.limits[key[0]] > 0)
+
+    def check(self, identifier: str, ip: Optional[str]) -> None:
+        for key in self._keys(identifier, ip):
+            if (self.failures.get(key) or 0) >= self.limits[key[0]]:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many failed login attempts, retry later",
+                    headers={"Retry-After": str(int(self.window))},
+                )
+
+    def record_failure(self, identifier: str, ip: Optional[str]) -> None:
+        with self._lock:
+            for key in self._keys(identifier, ip):
+                if self.failures.get(key) is None:
+                    # The window starts at the first failure
+                    self.failures.set(key, 1)
+                else:
+                    self.failures.incr(key, 1)
+
+    def reset(self, identifier: str) -> None:
+        self.failures.delete(("login", identifier.strip().lower()))
+
+
+login_limiter = LoginLimiter(
+    maxsize=settings.LOGIN_LIMITER_SIZE,
+    window=settings.LOGIN_FAILURE_WINDOW_SECONDS,
+    max_per_identifier=settings.LOGIN_MAX_FAILURES_PER_IDENTIFIER,
+    max_per_ip=settings.LOGIN_MAX_FAILURES_PER_IP,
+)
+
+
+# Hash checked when the login names no user, so unknown users cost the same
+# bcrypt verification as wrong passwords and cannot be told apart by timing.
+# Made once, by the startup warm-up or else by the first such login.
+_dummy_password_hash: Optional[str] = None
+
+
+def dummy_password_hash() -> str:
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = hash_executor.run(get_password_hash, secrets.token_urlsafe(16))
+    return _dummy_password_hash
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and, when its hash was made with a deprecated scheme
+    or other cost settings, also return a replacement hash made with the
+    current ones (verification and rehash in one hash pool job).
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hash_executor.run_async(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return await hash_executor.run_async(verify_and_update_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await hash_executor.run_async(get_password_hash, password)
+
+
+async def dummy_password_hash_async() -> str:
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = await get_password_hash_async(secrets.token_urlsafe(16))
+    return _dummy_password_hash
@@ -1,14 +1,27 @@
+import json
 import os
 import secrets
-from typing import List, Optional, Union
+from typing import Annotated, Dict, List, Literal, Optional, Union
 
-from pydantic import AnyHttpUrl, PostgresDsn, field_validator
-from pydantic_settings import BaseSettings
+from pydantic import AnyHttpUrl, field_validator
+from pydantic_settings import BaseSettings, NoDecode
+
+# List setting given as "a,b" or as a JSON array; the validator below parses
+# both, so the environment source must not try JSON first
+CommaList = Annotated[List[str], NoDecode]
 
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = os.environ.get("SECRET_KEY", secrets.token_urlsafe(32))
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
+    # Token signing keys by kid (JSON object): a secret signs HS256, a PEM
+    # P-256 / Ed25519 private key ES256 / EdDSA, a PEM public key only
+    # verifies. Empty: SECRET_KEY under the kid "default", which also checks
+    # tokens without a kid
+    JWT_KEYS: Dict[str, str] = {}
+    # kid new tokens are signed with (default: the first key); keep retired
+    # keys in JWT_KEYS until the tokens they signed have expired
+    JWT_ACTIVE_KID: Optional[str] = None
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
 
     @field_validator("BACKEND_CORS_ORIGINS", mode='before')
@@ -27,10 +40,169 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.environ.get("PGPASSWORD", "postgres")
     POSTGRES_DB: str = os.environ.get("PGDATABASE", "app")
     POSTGRES_PORT: str = os.environ.get("PGPORT", "5432")
-    DATABASE_URL: Optional[PostgresDsn] = os.environ.get(
+    # Any SQLAlchemy URL; PostgreSQL in production, SQLite works for local runs
+    DATABASE_URL: Optional[str] = os.environ.get(
         "DATABASE_URL", 
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
+    # Async driver URL; derived from DATABASE_URL (asyncpg/aiosqlite) when unset
+    ASYNC_DATABASE_URL: Optional[str] = os.environ.get("ASYNC_DATABASE_URL")
+    # Routers served by the async handlers on the async engine, e.g. ["items", "users"]
+    ASYNC_ROUTERS: CommaList = []
+
+    # Password hashing process pool (0 workers hashes inline in the request thread)
+    HASH_POOL_WORKERS: int = 2
+    # Jobs allowed to wait for a free worker before requests get 503
+    HASH_POOL_MAX_QUEUE: int = 64
+    HASH_RETRY_AFTER_SECONDS: int = 1
+
+    # Password hash schemes (bcrypt, argon2, scrypt); new hashes use the first,
+    # the others are still accepted and replaced on the next successful login
+    PASSWORD_SCHEMES: CommaList = ["bcrypt"]
+
+    # Hash cost (python -m app.hash_calibration picks values for a latency
+    # target); hashes made with other values are rehashed on login
+    BCRYPT_ROUNDS: int = 12
+    # argon2 needs argon2-cffi; memory cost is in KiB
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 1
+    # log2 of scrypt's CPU/memory cost N
+    SCRYPT_ROUNDS: int = 16
+
+    # Failed logins allowed per identifier / client IP within the window
+    # before further attempts get 429 without hashing (0 disables). The IP
+    # limit is off by default: behind a proxy every client shares its IP
+    LOGIN_MAX_FAILURES_PER_IDENTIFIER: int = 10
+    LOGIN_MAX_FAILURES_PER_IP: int = 0
+    # Header your reverse proxy sets to the client address (e.g. X-Real-IP or
+    # X-Forwarded-For, whose last entry is used); unset: the socket peer
+    CLIENT_IP_HEADER: Optional[str] = None
+    LOGIN_FAILURE_WINDOW_SECONDS: int = 300
+    LOGIN_LIMITER_SIZE: int = 100000
+
+    # Trust is_active/is_superuser claims in the JWT instead of loading the user
+    AUTH_STATELESS: bool = False
+    TOKEN_VERSION_CACHE_SIZE: int = 10000
+    TOKEN_VERSION_TTL_SECONDS: int = 60
+    # Decoded token + current user cache (0 disables); capped by the token's exp
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: int = 60
+
+    # Cache for single item/user reads: "none", "memory" (per worker process)
+    # or "redis" (any Redis-protocol server at CACHE_URL; needs redis-py)
+    CACHE_BACKEND: Literal["none", "memory", "redis"] = "none"
+    CACHE_URL: Optional[str] = None
+    # Namespace for this app's keys on a shared server
+    CACHE_KEY_PREFIX: str = "app:"
+    CACHE_TTL_SECONDS: int = 60
+    CACHE_MEMORY_SIZE: int = 10000
+    # Longest a fill may take before waiting requests load the value themselves
+    CACHE_LOCK_SECONDS: float = 5
+
+    # Upper bound on the number of rows in one bulk request
+    BULK_MAX_BATCH_SIZE: int = 500
+
+    # Routers whose list endpoints encode Core rows straight to JSON (orjson)
+    FAST_SERIALIZATION_ROUTERS: CommaList = []
+
+    # Read replicas for GET endpoints (comma separated SQLAlchemy URLs)
+    DATABASE_REPLICA_URLS: CommaList = []
+
+    # Comma separated lists, also accepted as JSON arrays
+    @field_validator(
+        "ASYNC_ROUTERS",
+        "PASSWORD_SCHEMES",
+        "FAST_SERIALIZATION_ROUTERS",
+        "DATABASE_REPLICA_URLS",
+        mode='before',
+    )
+    def assemble_lists(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str) and not v.startswith("["):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        elif isinstance(v, str):
+            return json.loads(v)
+        elif isinstance(v, list):
+            return v
+        raise ValueError(v)
+
+    # "round_robin" or "least_connections" (fewest checked-out connections)
+    REPLICA_ROUTING: Literal["round_robin", "least_connections"] = "round_robin"
+    # After a write, the user's reads stay on the primary for this long
+    REPLICA_STICKY_SECONDS: float = 5
+    REPLICA_STICKY_CACHE_SIZE: int = 10000
+
+    # Connection pool (per engine and per worker process)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 300
+    # "pre_ping" pings on every checkout, "idle" only pings connections idle
+    # for DB_POOL_PING_IDLE_SECONDS, "none" relies on pool_recycle alone
+    DB_POOL_LIVENESS: Literal["pre_ping", "idle", "none"] = "pre_ping"
+    DB_POOL_PING_IDLE_SECONDS: float = 30
+
+    # Create missing tables when a worker starts (local development; otherwise
+    # run `python -m app.manage init-db` once per deployment)
+    DB_INIT_ON_STARTUP: bool = False
+    # Connections each engine opens when a worker starts (0: connect lazily)
+    DB_POOL_WARM_CONNECTIONS: int = 1
+    # Startup stops waiting for the warm-up after this long and serves anyway
+    STARTUP_WARM_UP_TIMEOUT_SECONDS: float = 5
+
+    # Per-request SQL statement count/time (Server-Timing header)
+    QUERY_STATS_ENABLED: bool = True
+    # Requests running more statements than this are logged
+    QUERY_BUDGET: int = 20
+    # Strict mode (tests): raise once one statement shape repeats this often
+    QUERY_BUDGET_STRICT: bool = False
+    QUERY_REPEAT_LIMIT: int = 10
+
+    # Prometheus metrics (request latency per route, pools, threadpool, hash
+    # pool) in text format at METRICS_PATH
+    METRICS_ENABLED: bool = True
+    METRICS_PATH: str = "/metrics"
+    # Where each worker process writes its metrics so a scrape of any worker
+    # returns the server's totals; the gunicorn launcher sets one up if unset
+    METRICS_MULTIPROCESS_DIR: Optional[str] = None
+    METRICS_FLUSH_SECONDS: float = 5
+
+    # Sampling profiler (GET /api/v1/profiler/stacks, superusers only): profile
+    # one request in PROFILER_SAMPLE_EVERY (0: none) and every request with
+    # the header X-Profile: <PROFILER_HEADER_TOKEN>
+    PROFILER_ENABLED: bool = False
+    PROFILER_SAMPLE_EVERY: int = 100
+    PROFILER_HEADER_TOKEN: Optional[str] = None
+    PROFILER_INTERVAL_MS: float = 5
+    # Distinct stacks kept per route; further ones are counted together
+    PROFILER_MAX_STACKS: int = 5000
+
+    # Cached list totals (X-Total-Count with total=estimate)
+    COUNT_CACHE_SIZE: int = 10000
+    COUNT_CACHE_TTL_SECONDS: int = 60
+
+    # Full-text search ranks at most this many matches per query (0: all)
+    SEARCH_MAX_RANKED: int = 2000
+
+    # Rows fetched per server-side cursor batch by the export endpoints
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Production server (python -m app.server / gunicorn); 0 workers: one per CPU
+    SERVER_BIND: str = "0.0.0.0:8000"
+    SERVER_WORKERS: int = 0
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    # Pending connections the listen socket queues while every worker is busy
+    SERVER_BACKLOG: int = 2048
+    # Restart a worker after this many requests (0: never), plus up to
+    # JITTER more so the workers do not all restart at once
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_MAX_REQUESTS_JITTER: int = 0
+    # On SIGTERM, in-flight requests get this long to finish
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    # A worker silent for this long is killed and replaced
+    SERVER_TIMEOUT_SECONDS: int = 60
+    # Import the app once in the master; workers share its memory copy-on-write
+    SERVER_PRELOAD: bool = True
 
     class Config:
         case_sensitive = True
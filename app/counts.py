@@ -0,0 +1,91 @@
+from typing import Any, Hashable, Literal, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import LRUTTLCache
+from app.config import settings
+
+# "exact": COUNT(*) on every request
+# "estimate": cached counters, or the planner's row estimate for whole tables
+TotalMode = Literal["exact", "estimate"]
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# Key of a table-wide total in the counter cache
+ALL = "*"
+
+RELTUPLES = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)")
+
+
+class TotalCounter:
+    """
+    Row totals for one listing, optionally scoped to an owner.
+
+    Estimates are served from an in-process cache that the write endpoints
+    keep current with ``adjust``; entries expire after COUNT_CACHE_TTL_SECONDS
+    so writes made by other worker processes show up eventually. Table-wide
+    estimates on PostgreSQL come from ``pg_class.reltuples`` instead of a
+    full COUNT(*) scan.
+    """
+
+    def __init__(self, model: Any, owner_column: Optional[Any] = None):
+        self.model = model
+        self.owner_column = owner_column
+        self.cache = LRUTTLCache(
+            maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL_SECONDS
+        )
+
+    def key(self, user: Any) -> Hashable:
+        if self.owner_column is None or user.is_superuser:
+            return ALL
+        return user.id
+
+    def count_stmt(self, key: Hashable) -> Any:
+        stmt = select(func.count()).select_from(self.model)
+        if key != ALL:
+            stmt = stmt.where(self.owner_column == key)
+        return stmt
+
+    def adjust(self, owner_id: Optional[int], delta: int) -> None:
+        """
+        Account for ``delta`` rows created (or deleted, if negative).
+        """
+        self.cache.incr(ALL, delta)
+        if owner_id is not None:
+            self.cache.incr(owner_id, delta)
+
+    def total(self, db: Session, user: Any, mode: TotalMode) -> int:
+        key = self.key(user)
+        if mode == "estimate":
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            if key == ALL and db.get_bind().dialect.name == "postgresql":
+                estimate = db.scalar(RELTUPLES, {"name": self.model.__tablename__})
+                # -1 until the table has been vacuumed or analyzed
+                if estimate is not None and estimate >= 0:
+                    return estimate
+        value = db.scalar(self.count_stmt(key))
+        self.cache.set(key, value)
+        return value
+
+    async def total_async(self, db: AsyncSession, user: Any, mode: TotalMode) -> int:
+        key = self.key(user)
+        if mode == "estimate":
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            if key == ALL and db.get_bind().dialect.name == "postgresql":
+                estimate = await db.scalar(RELTUPLES, {"name": self.model.__tablename__})
+                if estimate is not None and estimate >= 0:
+                    return estimate
+        value = await db.scalar(self.count_stmt(key))
+        self.cache.set(key, value)
+        return value
+
+
+items = TotalCounter(models.Item, models.Item.owner_id)
+users = TotalCounter(models.User)
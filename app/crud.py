@@ -1,10 +1,12 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Generic, List, Optional, Sequence, Set, Type, TypeVar, Union
 
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import case, delete, insert, inspect, or_, select, update
 from sqlalchemy.orm import Session
 
+from app import models, schemas
 from app.database import Base
+from app.pagination import SortKey, paginate
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -27,16 +29,70 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        order_by: SortKey = "id",
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return paginate(
+            db.query(self.model), self.model,
+            order_by=order_by, cursor=cursor, skip=skip, limit=limit,
+        ).all()
+
+    # Single-row writes. Each mutation is one statement with RETURNING, so
+    # there is no follow-up SELECT (refresh) and no SELECT before the write.
+
+    def create_stmt(
+        self, obj_in: CreateSchemaType, values: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        obj_in_data = {**obj_in.model_dump(), **(values or {})}
+        return insert(self.model).values(**obj_in_data).returning(self.model)
+
+    def update_stmt(self, id: Any, values: Dict[str, Any], *criteria: Any) -> Any:
+        """
+        ``UPDATE ... WHERE id = :id AND <criteria> RETURNING *``.
+        """
+        return (
+            update(self.model)
+            .where(self.model.id == id, *criteria)
+            .values(values)
+            .returning(self.model)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
 
-    def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(**obj_in_data)
-        db.add(db_obj)
+    def remove_stmt(self, id: Any, *criteria: Any) -> Any:
+        return (
+            delete(self.model)
+            .where(self.model.id == id, *criteria)
+            .returning(self.model)
+            .execution_options(synchronize_session=False)
+        )
+
+    def update_data(
+        self, obj_in: Union[UpdateSchemaType, Dict[str, Any]], exclude_none: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Column values to write from an update schema or dict.
+        """
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True, exclude_none=exclude_none)
+        columns = inspect(self.model).column_attrs.keys()
+        return {field: value for field, value in update_data.items() if field in columns}
+
+    def create(
+        self,
+        db: Session,
+        *,
+        obj_in: CreateSchemaType,
+        values: Optional[Dict[str, Any]] = None,
+    ) -> ModelType:
+        db_obj = db.scalar(self.create_stmt(obj_in, values))
         db.commit()
-        db.refresh(db_obj)
         return db_obj
 
     def update(
@@ -46,21 +102,140 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj)
-        if isinstance(obj_in, dict):
-            update_data = obj_in
-        else:
-            update_data = obj_in.model_dump(exclude_unset=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
-        db.add(db_obj)
+        update_data = self.update_data(obj_in)
+        if not update_data:
+            return db_obj
+        db_obj = db.scalar(self.update_stmt(db_obj.id, update_data))
+        db.commit()
+        return db_obj
+
+    def update_by_id(
+        self,
+        db: Session,
+        *,
+        id: Any,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any] = (),
+    ) -> Optional[ModelType]:
+        """
+        Update without loading the row first; None if no row matched.
+        """
+        db_obj = db.scalar(self.update_stmt(id, self.update_data(obj_in), *criteria))
+        db.commit()
+        return db_obj
+
+    def remove(
+        self, db: Session, *, id: int, criteria: Sequence[Any] = ()
+    ) -> Optional[ModelType]:
+        db_obj = db.scalar(self.remove_stmt(id, *criteria))
         db.commit()
-        db.refresh(db_obj)
         return db_obj
 
-    def remove(self, db: Session, *, id: int) -> ModelType:
-        obj = db.query(self.model).get(id)
-        db.delete(obj)
+    # Bulk operations. Each one is a single statement with RETURNING; the
+    # statement builders are shared with the async endpoints.
+
+    def create_multi_stmt(
+        self, objs_in: Sequence[CreateSchemaType], values: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        Multi-row ``INSERT ... RETURNING``; rows come back in input order.
+        """
+        params = [{**obj_in.model_dump(), **(values or {})} for obj_in in objs_in]
+        stmt = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        return stmt, params
+
+    def update_multi_stmt(
+        self, updates: Dict[int, Dict[str, Any]], *criteria: Any
+    ) -> Any:
+        """
+        ``UPDATE ... SET col = CASE id WHEN .. END WHERE id IN (..) RETURNING``.
+
+        ``updates`` maps id -> changed fields; ``criteria`` (e.g. ownership)
+        are applied in the same WHERE clause.
+        """
+        columns: Set[str] = set()
+        for fields in updates.values():
+            columns.update(fields)
+        values = {}
+        for name in columns:
+            column = getattr(self.model, name)
+            whens = {id: fields[name] for id, fields in updates.items() if name in fields}
+            values[name] = case(whens, value=self.model.id, else_=column)
+        return (
+            update(self.model)
+            .where(self.model.id.in_(list(updates)), *criteria)
+            .values(values)
+            .returning(self.model)
+            .execution_options(synchronize_session=False)
+        )
+
+    def remove_multi_stmt(self, ids: Sequence[int], *criteria: Any) -> Any:
+        return (
+            delete(self.model)
+            .where(self.model.id.in_(list(ids)), *criteria)
+            .returning(self.model)
+            .execution_options(synchronize_session=False)
+        )
+
+    def existing_ids_stmt(self, ids: Sequence[int], *criteria: Any) -> Any:
+        return select(self.model.id).where(self.model.id.in_(list(ids)), *criteria)
+
+    def create_multi(
+        self,
+        db: Session,
+        *,
+        objs_in: Sequence[CreateSchemaType],
+        values: Optional[Dict[str, Any]] = None,
+    ) -> List[ModelType]:
+        stmt, params = self.create_multi_stmt(objs_in, values)
+        db_objs = db.scalars(stmt, params).all()
+        db.commit()
+        return db_objs
+
+    def update_multi(
+        self, db: Session, *, updates: Dict[int, Dict[str, Any]], criteria: Sequence[Any] = ()
+    ) -> List[ModelType]:
+        db_objs = db.scalars(self.update_multi_stmt(updates, *criteria)).all()
+        db.commit()
+        return db_objs
+
+    def remove_multi(
+        self, db: Session, *, ids: Sequence[int], criteria: Sequence[Any] = ()
+    ) -> List[ModelType]:
+        db_objs = db.scalars(self.remove_multi_stmt(ids, *criteria)).all()
         db.commit()
-        return obj
+        return db_objs
+
+    def existing_ids(
+        self, db: Session, *, ids: Sequence[int], criteria: Sequence[Any] = ()
+    ) -> Set[int]:
+        return set(db.scalars(self.existing_ids_stmt(ids, *criteria)))
+
+
+class CRUDItem(CRUDBase[models.Item, schemas.ItemCreate, schemas.ItemUpdate]):
+    def ownership_criteria(self, user: Any) -> List[Any]:
+        """
+        WHERE criteria limiting a statement to rows ``user`` may change.
+        """
+        if user.is_superuser:
+            return []
+        return [self.model.owner_id == user.id]
+
+
+class CRUDUser(CRUDBase[models.User, schemas.UserCreate, schemas.UserUpdate]):
+    def login_stmt(self, login: str) -> Any:
+        """
+        One lookup by username or email (both unique and indexed); if the
+        value is one user's username and another's email, the username wins.
+        """
+        User = self.model
+        return (
+            select(User)
+            .where(or_(User.username == login, User.email == login))
+            .order_by((User.username == login).desc())
+            .limit(1)
+        )
+
+
+item = CRUDItem(models.Item)
+user = CRUDUser(models.User)
@@ -1,18 +1,181 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.config import settings
+from app.pool import PoolMetrics, engine_options
+from app.replicas import ReplicaRouter
 
 engine = create_engine(
-    str(settings.DATABASE_URL),
-    pool_pre_ping=True,
-    pool_recycle=300
+    str(settings.DATABASE_URL), **engine_options(str(settings.DATABASE_URL))
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+pool_metrics = PoolMetrics("primary")
+pool_metrics.attach(engine)
+# Objects stay loaded after commit so results of RETURNING statements can be
+# serialized without a refresh SELECT per row
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+
+# Read replicas; every engine gets its own pool and metrics
+replica_engines = []
+replica_pool_metrics = []
+for index, url in enumerate(settings.DATABASE_REPLICA_URLS):
+    replica = create_engine(url, **engine_options(url))
+    metrics = PoolMetrics(f"replica-{index}")
+    metrics.attach(replica)
+    replica_engines.append(replica)
+    replica_pool_metrics.append(metrics)
+
+read_router = ReplicaRouter(engine, replica_engines, settings.REPLICA_ROUTING)
+
+
+def get_async_database_url() -> str:
+    """
+    Async driver URL for the configured database (asyncpg / aiosqlite).
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    return to_async_url(str(settings.DATABASE_URL))
+
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+# The async engine is only built when at least one router runs in async mode,
+# so the sync deployment does not need the async drivers installed.
+async_engine = None
+AsyncSessionLocal = None
+async_pool_metrics = None
+async_replica_engines = []
+if settings.ASYNC_ROUTERS:
+    async_engine = create_async_engine(
+        get_async_database_url(),
+        **engine_options(get_async_database_url(), is_async=True)
+    )
+    async_pool_metrics = PoolMetrics("async")
+    async_pool_metrics.attach(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+    for index, url in enumerate(settings.DATABASE_REPLICA_URLS):
+        async_url = to_async_url(url)
+        replica = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+        metrics = PoolMetrics(f"async-replica-{index}")
+        metrics.attach(replica.sync_engine)
+        async_replica_engines.append(replica)
+        replica_pool_metrics.append(metrics)
+async_read_router = ReplicaRouter(async_engine, async_replica_engines, settings.REPLICA_ROUTING)
 
 Base = declarative_base()
 
-# Initialize all tables in the database
+
+def dispose_engines(close: bool = True) -> None:
+    """
+    Empty every engine's pool.
+
+    ``close=False`` is for a forked child: the inherited connections belong
+    to the parent, so they are dropped without being closed and the child
+    opens its own.
+    """
+    for pooled in [engine, *replica_engines]:
+        pooled.dispose(close=close)
+    for pooled in [async_engine, *async_replica_engines] if async_engine is not None else []:
+        pooled.sync_engine.dispose(close=close)
+
+
+def _warm_count(pooled, connections: int) -> int:
+    # Single-connection pools (in-memory SQLite) have no size to fill
+    size = getattr(pooled.pool, "size", None)
+    return min(connections, size()) if size is not None else 0
+
+
+def warm_pools(connections: int) -> None:
+    """
+    Open up to ``connections`` connections in every sync engine's pool, so
+    the first requests do not pay for connecting.
+    """
+    for pooled in [engine, *replica_engines]:
+        held = []
+        try:
+            for _ in range(_warm_count(pooled, connections)):
+                held.append(pooled.connect())
+        finally:
+            for connection in held:
+                connection.close()
+
+
+async def warm_async_pools(connections: int) -> None:
+    """
+    ``warm_pools`` for the async engines; runs in the worker's event loop,
+    which the connections are bound to.
+    """
+    for pooled in [async_engine, *async_replica_engines] if async_engine is not None else []:
+        held = []
+        try:
+            for _ in range(_warm_count(pooled, connections)):
+                held.append(await pooled.connect())
+        finally:
+            for connection in held:
+                await connection.close()
+
+
+async def dispose_async_engines() -> None:
+    """
+    Close the async engines' connections while their event loop still runs
+    (aiosqlite connections also hold a thread each that would keep the
+    process alive).
+    """
+    for pooled in [async_engine, *async_replica_engines] if async_engine is not None else []:
+        await pooled.dispose()
+
+
+def pool_status() -> dict:
+    """
+    Pool occupancy and counters for every engine, for /health/db.
+    """
+    status = {pool_metrics.name: pool_metrics.snapshot()}
+    if async_pool_metrics is not None:
+        status[async_pool_metrics.name] = async_pool_metrics.snapshot()
+    for metrics in replica_pool_metrics:
+        status[metrics.name] = metrics.snapshot()
+    return status
+
+
+# Columns added to existing models since their tables were first created.
+# create_all never alters a table, so init_db adds these to older databases.
+ADDED_COLUMNS = [
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def add_missing_columns(connection) -> None:
+    """
+    Add the ADDED_COLUMNS an existing table lacks (idempotent, run by
+    init_db after create_all).
+    """
+    inspector = inspect(connection)
+    for table, column, ddl in ADDED_COLUMNS:
+        if column in {c["name"] for c in inspector.get_columns(table)}:
+            continue
+        if connection.dialect.name == "postgresql":
+            # Another init-db may be adding it at the same time
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+        else:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+# Initialize all tables in the database (python -m app.manage init-db)
 def init_db():
-    from app import models  # Import models here to avoid circular imports
-    Base.metadata.create_all(bind=engine)
+    from app import models, search  # Import models here to avoid circular imports
+    with engine.begin() as connection:
+        Base.metadata.create_all(bind=connection)
+        add_missing_columns(connection)
+        search.create_search_indexes(connection)
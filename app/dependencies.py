@@ -1,19 +1,52 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator, Optional, Union
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
 from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import models, schemas, crud
+from app import database, replicas
 from app.config import settings
 from app.database import SessionLocal
-from app.auth import ALGORITHM
+from app.auth import token_cache, token_codec, token_versions
+from app.tokens import TokenError, unverified_claims
+
+CurrentUser = Union[models.User, schemas.User, schemas.UserPrincipal]
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login/access-token")
 
 
+# Requests with these methods never write, so they do not make reads sticky
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def token_subject(request: Request) -> Optional[str]:
+    """
+    ``sub`` of the bearer token, unverified: only used to route reads, the
+    auth dependencies still validate the token.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        sub = unverified_claims(token).get("sub")
+    except TokenError:
+        return None
+    if isinstance(sub, bool) or not isinstance(sub, (str, int)):
+        return None
+    return str(sub)
+
+
+def mark_write(request: Request, token_data: schemas.TokenPayload) -> None:
+    # Writers read from the primary for a while (read-your-writes); keyed
+    # on the verified subject so a forged token cannot pin anyone else
+    if request.method not in SAFE_METHODS and token_data.sub is not None:
+        replicas.mark_write(str(token_data.sub))
+
+
 def get_db() -> Generator:
     try:
         db = SessionLocal()
@@ -22,40 +55,209 @@ def get_db() -> Generator:
         db.close()
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.User:
+def get_read_db(request: Request) -> Generator:
+    """
+    Session on a read replica, or on the primary for users who just wrote.
+    """
+    bind = database.read_router.choose(token_subject(request))
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[ALGORITHM]
-        )
-        token_data = schemas.TokenPayload(**payload)
-    except (jwt.JWTError, ValidationError):
+        db = SessionLocal(bind=bind)
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    if database.AsyncSessionLocal is None:
+        raise RuntimeError("Async database is not configured, set ASYNC_ROUTERS")
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request) -> AsyncGenerator:
+    if database.AsyncSessionLocal is None:
+        raise RuntimeError("Async database is not configured, set ASYNC_ROUTERS")
+    bind = database.async_read_router.choose(token_subject(request))
+    async with database.AsyncSessionLocal(bind=bind) as db:
+        yield db
+
+
+def decode_access_token(token: str) -> schemas.TokenPayload:
+    try:
+        return schemas.TokenPayload(**token_codec.decode(token))
+    except (TokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    
+
+
+def check_token_version(token_data: schemas.TokenPayload, version: Optional[int]) -> None:
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if token_data.ver is not None and token_data.ver < version:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Token has been revoked",
+        )
+
+
+def is_stateless_token(token_data: schemas.TokenPayload) -> bool:
+    return (
+        settings.AUTH_STATELESS
+        and token_data.ver is not None
+        and token_data.is_active is not None
+        and token_data.is_superuser is not None
+    )
+
+
+def principal_from_token(token_data: schemas.TokenPayload) -> schemas.UserPrincipal:
+    return schemas.UserPrincipal(
+        id=token_data.sub,
+        is_active=token_data.is_active,
+        is_superuser=token_data.is_superuser,
+    )
+
+
+def get_current_user(
+    request: Request,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme),
+) -> CurrentUser:
+    # Repeated tokens skip decoding and the user lookup entirely
+    cached = token_cache.get_token(token)
+    if cached is not None:
+        token_data, user = cached
+    else:
+        token_data, user = decode_access_token(token), None
+
+    # Stateless mode: trust the claims, only the token version is looked up
+    # (once per TTL) so revoked tokens are still refused
+    if is_stateless_token(token_data):
+        version = token_versions.get(token_data.sub)
+        if version is None:
+            version = db.scalar(
+                select(models.User.token_version).filter(models.User.id == token_data.sub)
+            )
+            if version is not None:
+                token_versions.set(token_data.sub, version)
+        check_token_version(token_data, version)
+        if user is None:
+            user = principal_from_token(token_data)
+            token_cache.set_token(token, token_data, user)
+        mark_write(request, token_data)
+        return user
+    if user is not None:
+        mark_write(request, token_data)
+        return user
+
     user = db.query(models.User).filter(models.User.id == token_data.sub).first()
-    
+
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    check_token_version(token_data, user.token_version)
+    token_cache.set_token(token, token_data, schemas.User.model_validate(user))
+    mark_write(request, token_data)
     return user
 
 
 def get_current_active_user(
-    current_user: models.User = Depends(get_current_user),
-) -> models.User:
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 def get_current_active_superuser(
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=400, detail="The user doesn't have enough privileges"
+        )
+    return current_user
+
+
+def get_current_active_user_row(
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user),
 ) -> models.User:
+    """
+    ORM row of the current user, loaded lazily when auth ran from claims only.
+    """
+    if isinstance(current_user, models.User):
+        return current_user
+    user = db.get(models.User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def get_current_user_async(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(oauth2_scheme),
+) -> CurrentUser:
+    cached = token_cache.get_token(token)
+    if cached is not None:
+        token_data, user = cached
+    else:
+        token_data, user = decode_access_token(token), None
+
+    if is_stateless_token(token_data):
+        version = token_versions.get(token_data.sub)
+        if version is None:
+            version = await db.scalar(
+                select(models.User.token_version).filter(models.User.id == token_data.sub)
+            )
+            if version is not None:
+                token_versions.set(token_data.sub, version)
+        check_token_version(token_data, version)
+        if user is None:
+            user = principal_from_token(token_data)
+            token_cache.set_token(token, token_data, user)
+        mark_write(request, token_data)
+        return user
+    if user is not None:
+        mark_write(request, token_data)
+        return user
+
+    user = await db.get(models.User, token_data.sub)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    check_token_version(token_data, user.token_version)
+    token_cache.set_token(token, token_data, schemas.User.model_validate(user))
+    mark_write(request, token_data)
+    return user
+
+
+async def get_current_active_user_async(
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> CurrentUser:
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+
+async def get_current_active_superuser_async(
+    current_user: CurrentUser = Depends(get_current_user_async),
+) -> CurrentUser:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+async def get_current_active_user_row_async(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_active_user_async),
+) -> models.User:
+    if isinstance(current_user, models.User):
+        return current_user
+    user = await db.get(models.User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
@@ -0,0 +1,107 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, List, Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import false
+
+from app.serialization import copy_headers
+
+# Responses differ per user, so shared caches must not store them, and
+# clients must revalidate (If-None-Match) before reusing one
+CACHE_CONTROL = "private, no-cache"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def version(updated_at: Optional[datetime]) -> int:
+    """
+    Row version: ``updated_at`` in microseconds since the epoch.
+    """
+    if updated_at is None:
+        return 0
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return (updated_at - EPOCH) // timedelta(microseconds=1)
+
+
+def entity_etag(obj: Any) -> str:
+    """
+    Weak ETag of one row, from its id and ``updated_at``.
+
+    Weak because the body's bytes depend on the serializer in use; the tag
+    only promises the same row version.
+    """
+    return f'W/"{obj.id}-{version(obj.updated_at)}"'
+
+
+def collection_etag(objs: Iterable[Any]) -> str:
+    """
+    Weak ETag of a page of rows: the newest ``updated_at`` on the page plus
+    a digest of the ids, so inserts and deletes change it as well as updates.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    latest = count = 0
+    for obj in objs:
+        digest.update(b"%d," % obj.id)
+        latest = max(latest, version(obj.updated_at))
+        count += 1
+    return f'W/"{count}-{latest}-{digest.hexdigest()}"'
+
+
+def _opaque_tags(header: str) -> List[str]:
+    # Weak comparison: W/"x" and "x" are the same tag
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag.strip('"'))
+    return tags
+
+
+def matches(header: Optional[str], etag: str) -> bool:
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque_tags(etag)[0] in _opaque_tags(header)
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set ``etag`` on ``response`` and, when the request's If-None-Match
+    already names it, return the 304 to send instead of the body.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if matches(request.headers.get("if-none-match"), etag):
+        return copy_headers(response, Response(status_code=304))
+    return None
+
+
+def version_criteria(model: Any, id: int, if_match: Optional[str]) -> List[Any]:
+    """
+    WHERE criteria for a write conditioned on If-Match: the row's
+    ``updated_at`` must still be one of the versions the client named.
+
+    Added to the UPDATE/DELETE itself, so the check and the write are one
+    statement. No header or ``*`` adds nothing.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return []
+    versions = []
+    for tag in _opaque_tags(if_match):
+        tag_id, _, tag_version = tag.partition("-")
+        if tag_id == str(id) and tag_version.isdigit():
+            versions.append(EPOCH + timedelta(microseconds=int(tag_version)))
+    if not versions:
+        return [false()]
+    return [model.updated_at.in_(versions)]
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=412, detail="The resource was modified since it was read (If-Match)"
+    )
@@ -0,0 +1,104 @@
+"""
+Pick password hash cost settings for a latency target on this machine.
+
+    python -m app.hash_calibration [target_ms] [scheme]
+
+Times one hash of ``scheme`` (the first of PASSWORD_SCHEMES by default) at
+increasing rounds and prints the highest cost that stays within
+``target_ms`` (250 by default), as the setting to deploy. Run it on the
+production hardware before changing the cost: every login of a user whose
+hash was made with another cost pays for a rehash. It also reports hashes
+per second for one process and per core with every core hashing at once,
+which is the login capacity of the hash pool (HASH_POOL_WORKERS).
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from app.auth import HASH_ROUNDS_SETTINGS, password_context
+from app.config import settings
+
+# Cheapest rounds passlib accepts, where the search starts
+MIN_ROUNDS = {"bcrypt": 4, "argon2": 1, "scrypt": 1}
+SAMPLES = 5
+PASSWORD = "calibration-password"
+
+
+def time_hash(scheme: str, rounds: int, samples: int = SAMPLES) -> float:
+    """
+    Median seconds for one hash of ``scheme`` at ``rounds``.
+    """
+    context = password_context([scheme], {scheme: rounds})
+    context.hash(PASSWORD)  # warm up (imports, backend detection)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash(PASSWORD)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate(scheme: str, target_ms: float) -> Tuple[int, List[Tuple[int, float]]]:
+    """
+    Highest rounds of ``scheme`` hashing within ``target_ms``, and the
+    (rounds, seconds) measurements taken on the way.
+    """
+    rounds = MIN_ROUNDS[scheme]
+    measured = [(rounds, time_hash(scheme, rounds))]
+    while measured[-1][1] * 1000 <= target_ms:
+        rounds += 1
+        measured.append((rounds, time_hash(scheme, rounds)))
+    fitting = [r for r, seconds in measured if seconds * 1000 <= target_ms]
+    return (fitting[-1] if fitting else MIN_ROUNDS[scheme]), measured
+
+
+def _hash_loop(scheme: str, rounds: int, seconds: float) -> int:
+    context = password_context([scheme], {scheme: rounds})
+    deadline = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < deadline:
+        context.hash(PASSWORD)
+        count += 1
+    return count
+
+
+def throughput(scheme: str, rounds: int, processes: int, seconds: float = 3.0) -> float:
+    """
+    Hashes per second with ``processes`` processes hashing at once.
+    """
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start every worker before timing
+        list(pool.map(_hash_loop, [scheme] * processes, [MIN_ROUNDS[scheme]] * processes, [0] * processes))
+        counts = pool.map(_hash_loop, [scheme] * processes, [rounds] * processes, [seconds] * processes)
+        return sum(counts) / seconds
+
+
+def main(target_ms: float = 250.0, scheme: Optional[str] = None) -> None:
+    scheme = scheme or settings.PASSWORD_SCHEMES[0]
+    if scheme not in HASH_ROUNDS_SETTINGS:
+        sys.exit(f"Unknown scheme {scheme!r}, expected one of {', '.join(HASH_ROUNDS_SETTINGS)}")
+    handler = password_context([scheme]).handler(scheme)
+    if not handler.has_backend():
+        sys.exit(f"No {scheme} backend installed (bcrypt needs bcrypt, argon2 needs argon2-cffi)")
+    setting = HASH_ROUNDS_SETTINGS[scheme]
+    print(f"{scheme}, target {target_ms:.0f} ms per hash")
+    rounds, measured = calibrate(scheme, target_ms)
+    for r, seconds in measured:
+        print(f"  rounds {r:3}  {seconds * 1000:9.1f} ms")
+    cores = os.cpu_count() or 1
+    single = throughput(scheme, rounds, 1)
+    parallel = throughput(scheme, rounds, cores)
+    print(
+        f"rounds {rounds}: {single:.1f} hashes/s on one core, "
+        f"{parallel / cores:.1f} hashes/s per core with all {cores} cores busy "
+        f"({parallel:.1f} hashes/s total)"
+    )
+    print(f"{setting}={rounds}  (currently {getattr(settings, setting)})")
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if index == 0 else arg for index, arg in enumerate(sys.argv[1:3])))
@@ -0,0 +1,153 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.metrics import Histogram
+
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[Any, float, float]:
+    # Runs in the worker process; wall clock timestamps are comparable
+    # across processes, monotonic clocks are not guaranteed to be.
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class HashExecutor:
+    """
+    Bounded process pool for password hashing.
+
+    bcrypt holds the GIL for the whole hash, so running it in the request
+    thread stalls every other request in the worker. Jobs are sent to a
+    process pool instead, and once more than ``max_queue`` jobs are waiting
+    for a free process new jobs are rejected with 503 / Retry-After.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, retry_after: int = 1):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait = Histogram()
+        self.hash_time = Histogram()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process is not safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        # A worker process died, after which the pool fails every job; the
+        # next submit starts a new one (the broken pool already stopped its
+        # processes)
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def submit(self, fn: Callable, *args: Any) -> Future:
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent password operations, retry later",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self.pending += 1
+            pool = self._get_pool()
+        submitted = time.time()
+        try:
+            try:
+                inner = pool.submit(_timed_call, fn, args)
+            except BrokenProcessPool:
+                # Nothing ran yet, so the job can go to a fresh pool
+                self._discard_pool(pool)
+                with self._lock:
+                    pool = self._get_pool()
+                inner = pool.submit(_timed_call, fn, args)
+        except BaseException as exc:
+            # The slot taken above is released, or it would leak
+            with self._lock:
+                self.pending -= 1
+            if isinstance(exc, BrokenProcessPool):
+                self._discard_pool(pool)
+            raise
+        outer: Future = Future()
+
+        def _done(f: Future) -> None:
+            with self._lock:
+                self.pending -= 1
+            if f.cancelled():
+                outer.cancel()
+                return
+            exc = f.exception()
+            if exc is not None:
+                if isinstance(exc, BrokenProcessPool):
+                    self._discard_pool(pool)
+                outer.set_exception(exc)
+                return
+            result, started, finished = f.result()
+            with self._lock:
+                self.completed += 1
+                self.queue_wait.observe(max(started - submitted, 0.0))
+                self.hash_time.observe(finished - started)
+            outer.set_result(result)
+
+        inner.add_done_callback(_done)
+        return outer
+
+    def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run ``fn`` in the pool and wait for it (for sync handlers).
+        """
+        if not self.enabled:
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable, *args: Any) -> Any:
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_wait_seconds": self.queue_wait.snapshot(),
+                "hash_seconds": self.hash_time.snapshot(),
+            }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+hash_executor = HashExecutor(
+    max_workers=settings.HASH_POOL_WORKERS,
+    max_queue=settings.HASH_POOL_MAX_QUEUE,
+    retry_after=settings.HASH_RETRY_AFTER_SECONDS,
+)
@@ -1,10 +1,19 @@
 from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 
+from app.api import bulk
 from app.api.api import api_router
+from app.auth import token_codec
 from app.config import settings
-from app.database import init_db
+from app.counts import TOTAL_COUNT_HEADER
+from app.database import pool_status
+from app.pagination import NEXT_CURSOR_HEADER
+from app.profiler import ProfilingMiddleware
+from app.prometheus import MetricsMiddleware, metrics_endpoint
+from app.query_budget import QueryBudgetMiddleware
+from app.startup import lifespan
 
 # Create FastAPI application
 app = FastAPI(
@@ -13,6 +22,7 @@ app = FastAPI(
     version="0.1.0",
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url=None,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -23,14 +33,28 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, "ETag", "Server-Timing"],
     )
 
-# Initialize the database tables
-init_db()
+# Stack samples of every PROFILER_SAMPLE_EVERY-th request
+if settings.PROFILER_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Count SQL statements per request (Server-Timing, budget warnings)
+if settings.QUERY_STATS_ENABLED:
+    app.add_middleware(QueryBudgetMiddleware)
+
+# Latency per route and status; outermost, so it times the whole stack
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.add_route(settings.METRICS_PATH, metrics_endpoint, include_in_schema=False)
 
 # Include all API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Oversized bulk bodies are 413, not 422
+app.add_exception_handler(RequestValidationError, bulk.validation_exception_handler)
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
@@ -43,3 +67,20 @@ async def custom_swagger_ui_html():
 @app.get("/", tags=["Health"])
 def health_check():
     return {"status": "ok", "message": "FastAPI CRUD Application is running"}
+
+
+@app.get("/.well-known/jwks.json", tags=["Authentication"])
+def jwks():
+    """
+    Public keys that verify access tokens (ES256 / EdDSA keys only), so
+    other services can check tokens without the signing keys.
+    """
+    return token_codec.jwks()
+
+
+@app.get("/health/db", tags=["Health"])
+def database_health():
+    """
+    Connection pool occupancy, checkout wait histogram and connection churn.
+    """
+    return {"status": "ok", "pools": pool_status()}
@@ -0,0 +1,37 @@
+"""
+Deployment tasks, run once per deployment rather than by every worker.
+
+    python -m app.manage init-db    # create missing tables, columns and indexes
+    python -m app.manage generate-jwt-key ES256    # PEM key for JWT_KEYS
+"""
+import argparse
+import json
+import time
+
+from app.database import init_db
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init-db", help="create missing tables, columns and search indexes")
+    generate = commands.add_parser(
+        "generate-jwt-key", help="print a new private key for JWT_KEYS and its public JWK"
+    )
+    generate.add_argument("algorithm", choices=["ES256", "EdDSA"])
+    args = parser.parse_args()
+
+    if args.command == "init-db":
+        started = time.perf_counter()
+        init_db()
+        print(f"Database initialized in {time.perf_counter() - started:.2f}s")
+    elif args.command == "generate-jwt-key":
+        from app.tokens import generate_private_key, load_key
+
+        private_key = generate_private_key(args.algorithm)
+        print(private_key, end="")
+        print(json.dumps(load_key(private_key).public_jwk()))
+
+
+if __name__ == "__main__":
+    main()
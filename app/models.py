@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -14,11 +14,18 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
+    # Bumped to revoke every token issued before the change
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     items = relationship("Item", back_populates="owner")
 
+    __table_args__ = (
+        # Keyset pagination ordered by creation time
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+
 
 class Item(Base):
     __tablename__ = "items"
@@ -31,3 +38,10 @@ class Item(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     owner = relationship("User", back_populates="items")
+
+    __table_args__ = (
+        # Keyset pagination: per-owner listings become index range scans
+        Index("ix_items_owner_id_id", "owner_id", "id"),
+        Index("ix_items_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        Index("ix_items_created_at_id", "created_at", "id"),
+    )
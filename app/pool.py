@@ -0,0 +1,180 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.config import settings
+from app.metrics import Histogram
+
+# Checkout waits are usually sub-millisecond, so the buckets start lower
+# than the request latency ones
+CHECKOUT_WAIT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class PoolMetrics:
+    """
+    Connection pool counters for one engine, fed by SQLAlchemy pool events.
+
+    Checkout wait is timed by the pool classes below, since the pool emits
+    no event before it starts waiting for a connection.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self._lock = threading.Lock()
+        self.checkout_wait = Histogram(CHECKOUT_WAIT_BUCKETS)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.invalidated = 0
+        self.liveness_pings = 0
+        self.liveness_failures = 0
+
+    def attach(self, engine: Any) -> None:
+        pool = engine.pool
+        self.pool = pool
+        if isinstance(pool, TimedPoolMixin):
+            pool.metrics = self
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "close", self._on_close)
+        event.listen(pool, "close_detached", self._on_close_detached)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        event.listen(pool, "soft_invalidate", self._on_invalidate)
+        if settings.DB_POOL_LIVENESS == "idle":
+            event.listen(pool, "checkin", _mark_checkin)
+            event.listen(pool, "checkout", _idle_liveness_check(engine.dialect, self))
+
+    def observe_checkout(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+            else:
+                self.checkouts += 1
+            self.checkout_wait.observe(seconds)
+
+    def increment(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self.increment("opened")
+
+    def _on_close(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self.increment("closed")
+
+    def _on_close_detached(self, dbapi_connection: Any) -> None:
+        self.increment("closed")
+
+    def _on_invalidate(self, dbapi_connection: Any, connection_record: Any, exception: Any) -> None:
+        self.increment("invalidated")
+
+    def snapshot(self) -> Dict[str, Any]:
+        pool = self.pool
+        status: Dict[str, Any] = {"pool": type(pool).__name__ if pool else None}
+        if isinstance(pool, QueuePool):
+            status.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        with self._lock:
+            status.update(
+                checkouts=self.checkouts,
+                checkout_timeouts=self.checkout_timeouts,
+                checkout_wait_seconds=self.checkout_wait.snapshot(),
+                connections_opened=self.opened,
+                connections_closed=self.closed,
+                connections_invalidated=self.invalidated,
+                liveness_pings=self.liveness_pings,
+                liveness_failures=self.liveness_failures,
+            )
+        return status
+
+
+class TimedPoolMixin:
+    """
+    Times ``connect()`` (the wait for a pooled or new connection).
+    """
+
+    metrics: Optional[PoolMetrics] = None
+
+    def connect(self) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.observe_checkout(time.perf_counter() - started, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe_checkout(time.perf_counter() - started)
+        return connection
+
+    def recreate(self) -> Any:
+        # engine.dispose() swaps in a new pool; keep reporting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _mark_checkin(dbapi_connection: Any, connection_record: Any) -> None:
+    if connection_record is not None:
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+
+def _idle_liveness_check(dialect: Any, metrics: PoolMetrics) -> Any:
+    def checkout(dbapi_connection: Any, connection_record: Any, connection_proxy: Any) -> None:
+        # Fresh connections and recently used ones are trusted without a ping
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None:
+            return
+        if time.monotonic() - checked_in_at < settings.DB_POOL_PING_IDLE_SECONDS:
+            return
+        metrics.increment("liveness_pings")
+        try:
+            dialect.do_ping(dbapi_connection)
+        except Exception:
+            metrics.increment("liveness_failures")
+            # The pool discards this connection and retries the checkout
+            raise exc.DisconnectionError()
+
+    return checkout
+
+
+def engine_options(url: str, is_async: bool = False) -> Dict[str, Any]:
+    """
+    create_engine() pool arguments from the DB_POOL_* settings.
+    """
+    options: Dict[str, Any] = {
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_LIVENESS == "pre_ping",
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite lives in a single connection; keep its default pool
+        return options
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    return options
@@ -0,0 +1,240 @@
+"""
+Sampling profiler for production requests.
+
+One request in PROFILER_SAMPLE_EVERY, and every request whose
+``X-Profile`` header carries PROFILER_HEADER_TOKEN, is profiled: while it
+runs, a background thread takes its stack every PROFILER_INTERVAL_MS and
+counts the collapsed stacks (``frame;frame;frame count``) per route. The
+profiled request itself runs untouched, so the cost is one stack walk per
+interval while a profiled request is in flight, and nothing otherwise.
+
+Stacks are wall clock: a request waiting on the database shows the wait.
+When the request's task runs on the event loop its thread's stack is
+taken; while it awaits a threadpool thread (sync handlers and
+dependencies) that thread's stack is appended to the task's await chain;
+otherwise the await chain ends in what it is waiting for.
+"""
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.prometheus import route_template
+
+PROFILE_HEADER = "x-profile"
+_TRUNCATED = "[more stacks than PROFILER_MAX_STACKS]"
+
+_labels: Dict[Any, str] = {}
+_prefixes = sorted({os.path.abspath(p) for p in sys.path if p}, key=len, reverse=True)
+
+
+def _label(code: Any) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for prefix in _prefixes:
+            if filename.startswith(prefix + os.sep):
+                filename = filename[len(prefix) + 1:]
+                break
+        # First line rather than the current one, so a function is one frame
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _labels[code] = f"{name} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def _thread_stack(frame: Any) -> List[Any]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro: Any) -> Tuple[List[Any], Any]:
+    """
+    Frames of a suspended coroutine and the coroutines it awaits, outermost
+    first, and the innermost awaited object that is not a coroutine.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames, coro
+
+
+def _awaited_thread(frames: List[Any]) -> Optional[threading.Thread]:
+    # The threadpool keeps the worker thread running the call in a local of
+    # the awaiting coroutine (anyio's run_sync_in_worker_thread)
+    for frame in reversed(frames[-3:]):
+        for value in frame.f_locals.values():
+            if isinstance(value, threading.Thread):
+                return value
+    return None
+
+
+def _from(frames: List[Any], code: Any) -> List[Any]:
+    # Drop the server and event loop frames below the profiling middleware
+    for index, frame in enumerate(frames):
+        if frame.f_code is code:
+            return frames[index:]
+    return frames
+
+
+class RequestProfile:
+    """
+    Stacks sampled from one profiled request.
+    """
+
+    def __init__(self, task: "asyncio.Task[Any]", loop: asyncio.AbstractEventLoop, thread_id: int):
+        self.task = task
+        self.loop = loop
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample(self, frames: Dict[int, Any], root: Any) -> None:
+        if asyncio.current_task(self.loop) is self.task:
+            stack = _from(_thread_stack(frames.get(self.thread_id)), root)
+            leaf: List[str] = []
+        else:
+            stack, awaited = _await_chain(self.task.get_coro())
+            stack = _from(stack, root)
+            thread = _awaited_thread(stack)
+            if thread is not None and thread.ident in frames:
+                in_thread = _thread_stack(frames[thread.ident])
+                # Everything above the pool's own run loop is the call
+                runs = [i for i, f in enumerate(in_thread) if f.f_code.co_name == "run"]
+                stack = stack + in_thread[runs[0] + 1:] if runs else stack + in_thread
+                leaf = []
+            else:
+                leaf = [f"[await {type(awaited).__name__}]"] if awaited is not None else []
+        if stack:
+            self.stacks[";".join([*(_label(f.f_code) for f in stack), *leaf])] += 1
+            self.samples += 1
+
+
+class Profiler:
+    """
+    Sampler thread and per-route collapsed stack counts of this process.
+
+    The thread sleeps while no profiled request is in flight.
+    """
+
+    def __init__(self, interval: float, max_stacks: int):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.routes: Dict[str, Dict[str, Any]] = {}
+        self.active: Dict[int, RequestProfile] = {}
+        self.root: Any = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counter = 0
+
+    def should_profile(self, scope: Any) -> bool:
+        token = settings.PROFILER_HEADER_TOKEN
+        if token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    return secrets.compare_digest(value, token.encode())
+        if settings.PROFILER_SAMPLE_EVERY <= 0:
+            return False
+        # Only the event loop thread counts, so no lock
+        self._counter += 1
+        return self._counter % settings.PROFILER_SAMPLE_EVERY == 0
+
+    def start(self) -> RequestProfile:
+        profile = RequestProfile(
+            asyncio.current_task(), asyncio.get_running_loop(), threading.get_ident()
+        )
+        with self._lock:
+            self.active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return profile
+
+    def finish(self, profile: RequestProfile, route: str) -> None:
+        with self._lock:
+            del self.active[id(profile)]
+            if not self.active:
+                self._wake.clear()
+            entry = self.routes.setdefault(route, {"requests": 0, "samples": 0, "stacks": Counter()})
+            entry["requests"] += 1
+            entry["samples"] += profile.samples
+            stacks = entry["stacks"]
+            for stack, count in profile.stacks.items():
+                if stack in stacks or len(stacks) < self.max_stacks:
+                    stacks[stack] += count
+                else:
+                    stacks[_TRUNCATED] += count
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            with self._lock:
+                profiles = list(self.active.values())
+            frames = sys._current_frames()
+            for profile in profiles:
+                try:
+                    profile.sample(frames, self.root)
+                except Exception:  # a frame can finish while it is read
+                    pass
+            del frames
+            time.sleep(self.interval)
+
+    def snapshot(self, route: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {**entry, "stacks": dict(entry["stacks"])}
+                for name, entry in self.routes.items()
+                if route is None or name == route
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.routes.clear()
+
+
+def collapsed(routes: Dict[str, Dict[str, Any]]) -> str:
+    """
+    flamegraph.pl / speedscope input, with the route as the root frame.
+    """
+    lines = []
+    for route, entry in sorted(routes.items()):
+        for stack, count in sorted(entry["stacks"].items()):
+            lines.append(f"{route};{stack} {count}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+profiler = Profiler(settings.PROFILER_INTERVAL_MS / 1000, settings.PROFILER_MAX_STACKS)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests ``profiler.should_profile`` picks.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        profiler.root = ProfilingMiddleware.__call__.__code__
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.finish(profile, f"{scope['method']} {route_template(scope)}")
@@ -0,0 +1,465 @@
+"""
+Prometheus metrics in the text exposition format, served at METRICS_PATH.
+
+Request latency per route and status, in-flight requests, threadpool
+saturation, the connection pools, the password hash pool and the auth
+caches. Every worker process aggregates its own numbers; under gunicorn
+each worker also writes them to METRICS_MULTIPROCESS_DIR every
+METRICS_FLUSH_SECONDS, and the worker answering a scrape adds up all the
+files, so one scrape covers the whole server. Files of exited workers are
+folded into one archive file and deleted.
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from anyio import to_thread
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.config import settings
+from app.metrics import Histogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Route label of requests no route matched (404s); the raw path would give
+# every probed URL its own series
+UNMATCHED_ROUTE = "<unmatched>"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metric:
+    """
+    One metric family. Samples are keyed by their label pairs; histogram
+    samples are ``Histogram.snapshot()`` dicts, the others numbers.
+    """
+
+    def __init__(self, name: str, kind: str, help: str):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples: Dict[Labels, Any] = {}
+
+    def add(self, value: Any, **labels: str) -> "Metric":
+        self.samples[tuple(sorted(labels.items()))] = value
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "kind": self.kind, "help": self.help,
+            "samples": [[list(labels), value] for labels, value in self.samples.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Metric":
+        metric = cls(data["name"], data["kind"], data["help"])
+        for labels, value in data["samples"]:
+            metric.samples[tuple(tuple(pair) for pair in labels)] = value
+        return metric
+
+
+class RequestMetrics:
+    """
+    Request latency histograms and in-flight count of this worker.
+
+    Only the event loop thread touches them (the middleware and the metrics
+    endpoint both run there), so there is no locking on the request path.
+    """
+
+    def __init__(self) -> None:
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self.in_flight = 0
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, str(status))
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(seconds)
+
+
+request_metrics = RequestMetrics()
+
+
+def route_template(scope: Any) -> str:
+    """
+    Path template of the route that served the request, with the prefixes
+    of the routers it was included through: ``/api/v1/items/{id}``.
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return UNMATCHED_ROUTE
+    # Depending on the FastAPI version the route's own template may lack
+    # the include prefixes; they are what precedes the filled-in template
+    path = scope["path"]
+    try:
+        filled = path_format.format(**{k: str(v) for k, v in scope.get("path_params", {}).items()})
+    except (KeyError, IndexError, ValueError):
+        return path_format
+    if path.endswith(filled):
+        return path[:len(path) - len(filled)] + path_format
+    return path_format
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request and labels it with its route template, e.g.
+    ``/api/v1/items/{id}``, so ids do not multiply the series.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message: Any) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        request_metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.in_flight -= 1
+            request_metrics.observe(
+                scope["method"], route_template(scope), status, time.perf_counter() - started
+            )
+
+
+def _pool_metrics() -> List[Metric]:
+    from app.database import pool_status
+
+    gauges = {
+        "size": "Configured pool size",
+        "checked_out": "Connections in use",
+        "idle": "Connections idle in the pool",
+        "overflow": "Connections open beyond the pool size",
+    }
+    counters = {
+        "checkouts": "Connections handed out",
+        "checkout_timeouts": "Checkouts that gave up waiting for a connection",
+        "connections_opened": "Connections opened",
+        "connections_closed": "Connections closed",
+        "connections_invalidated": "Connections invalidated after errors",
+        "liveness_pings": "Liveness pings on checkout",
+        "liveness_failures": "Liveness pings that found a dead connection",
+    }
+    metrics = {key: Metric(f"db_pool_{key}", "gauge", text) for key, text in gauges.items()}
+    metrics.update(
+        {key: Metric(f"db_pool_{key}_total", "counter", text) for key, text in counters.items()}
+    )
+    wait = Metric("db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a connection")
+    for pool, status in pool_status().items():
+        for key, metric in metrics.items():
+            if key in status:
+                metric.add(status[key], pool=pool)
+        wait.add(status["checkout_wait_seconds"], pool=pool)
+    return [*metrics.values(), wait]
+
+
+def _hash_pool_metrics() -> List[Metric]:
+    from app.hashing import hash_executor
+
+    stats = hash_executor.stats()
+    return [
+        Metric("hash_pool_workers", "gauge", "Password hashing processes").add(stats["workers"]),
+        Metric("hash_pool_pending", "gauge", "Hash jobs running or queued").add(stats["pending"]),
+        Metric("hash_pool_completed_total", "counter", "Hash jobs completed").add(stats["completed"]),
+        Metric("hash_pool_rejected_total", "counter",
+               "Hash jobs rejected with 503 because the queue was full").add(stats["rejected"]),
+        Metric("hash_pool_queue_wait_seconds", "histogram",
+               "Time hash jobs waited for a free process").add(stats["queue_wait_seconds"]),
+        Metric("hash_pool_hash_seconds", "histogram", "Time spent hashing").add(stats["hash_seconds"]),
+    ]
+
+
+def _auth_cache_metrics() -> List[Metric]:
+    from app.auth import token_cache, token_versions
+
+    entries = Metric("auth_cache_entries", "gauge", "Entries in the auth caches")
+    capacity = Metric("auth_cache_capacity", "gauge", "Auth cache size limit")
+    counters = {
+        "hits": Metric("auth_cache_hits_total", "counter",
+                       "Lookups that skipped a token decode or a user/version query"),
+        "misses": Metric("auth_cache_misses_total", "counter", "Lookups that had to decode or query"),
+        "evictions": Metric("auth_cache_evictions_total", "counter",
+                            "Entries dropped to stay within the size limit"),
+        "expirations": Metric("auth_cache_expirations_total", "counter", "Entries dropped at their TTL"),
+    }
+    # "token": decoded token + current user; "token_version": stateless mode
+    for name, cache in (("token", token_cache), ("token_version", token_versions)):
+        stats = cache.stats()
+        entries.add(stats["size"], cache=name)
+        capacity.add(stats["maxsize"], cache=name)
+        for key, metric in counters.items():
+            metric.add(stats[key], cache=name)
+    return [entries, capacity, *counters.values()]
+
+
+def _threadpool_metrics() -> List[Metric]:
+    # The pool sync handlers and dependencies run in
+    limiter = to_thread.current_default_thread_limiter()
+    return [
+        Metric("threadpool_threads_busy", "gauge",
+               "Threadpool threads running sync handlers").add(limiter.borrowed_tokens),
+        Metric("threadpool_threads_max", "gauge", "Threadpool size").add(limiter.total_tokens),
+        Metric("threadpool_tasks_waiting", "gauge",
+               "Tasks waiting for a free threadpool thread").add(limiter.statistics().tasks_waiting),
+    ]
+
+
+def collect() -> List[Metric]:
+    """
+    This worker's metrics; call from the event loop thread.
+    """
+    latency = Metric(
+        "http_request_duration_seconds", "histogram", "HTTP request latency by route and status"
+    )
+    for (method, route, status), histogram in list(request_metrics.latency.items()):
+        latency.add(histogram.snapshot(), method=method, route=route, status=status)
+    in_flight = Metric("http_requests_in_flight", "gauge", "HTTP requests being served")
+    in_flight.add(request_metrics.in_flight)
+    return [
+        latency, in_flight, *_threadpool_metrics(), *_pool_metrics(), *_hash_pool_metrics(),
+        *_auth_cache_metrics(),
+    ]
+
+
+# This worker's (pid, start time); the file name carries both, so a new
+# process that gets a dead worker's pid does not take over its file
+_worker: Tuple[int, int] = (0, 0)
+
+# Counters and histograms of exited workers, folded into one file
+ARCHIVE_FILE = "archive.json"
+
+
+def _worker_id() -> Tuple[int, int]:
+    global _worker
+    # Set after the fork: with a preloaded app the module is imported once
+    # in the master for all workers
+    if _worker[0] != os.getpid():
+        _worker = (os.getpid(), time.time_ns())
+    return _worker
+
+
+def _worker_file(directory: str, worker: Tuple[int, int]) -> str:
+    return os.path.join(directory, f"worker-{worker[0]}-{worker[1]}.json")
+
+
+def _file_worker(path: str) -> Tuple[int, int]:
+    pid, started = os.path.basename(path)[len("worker-"):-len(".json")].split("-")
+    return int(pid), int(started)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: str, data: Any) -> None:
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    # Readers never see a half-written file
+    os.replace(path + ".tmp", path)
+
+
+def write_worker_file(directory: str, metrics: List[Metric]) -> None:
+    _write_json(_worker_file(directory, _worker_id()), [metric.to_dict() for metric in metrics])
+
+
+def _read_families(path: str) -> List[Metric]:
+    with open(path) as f:
+        return [Metric.from_dict(data) for data in json.load(f)]
+
+
+def _merge_histogram(total: Dict[str, Any], snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "buckets": {
+            bound: total["buckets"].get(bound, 0) + count
+            for bound, count in snapshot["buckets"].items()
+        },
+        "sum": total["sum"] + snapshot["sum"],
+        "count": total["count"] + snapshot["count"],
+    }
+
+
+def _add_family(merged: Dict[str, Metric], family: Metric) -> None:
+    total = merged.setdefault(family.name, Metric(family.name, family.kind, family.help))
+    for labels, value in family.samples.items():
+        if labels not in total.samples:
+            total.samples[labels] = value
+        elif family.kind == "histogram":
+            total.samples[labels] = _merge_histogram(total.samples[labels], value)
+        else:
+            total.samples[labels] += value
+
+
+def _archive(directory: str, paths: List[str]) -> None:
+    """
+    Fold the counters and histograms of exited workers' files into
+    ARCHIVE_FILE and delete the files, so the directory does not grow with
+    every replaced worker. Gauges of exited workers describe nothing and
+    are dropped.
+    """
+    with open(os.path.join(directory, ARCHIVE_FILE + ".lock"), "a") as lock:
+        # Workers answering scrapes at the same time must not both fold
+        # the same file in
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        try:
+            with open(archive_path) as f:
+                archive = json.load(f)
+        except (OSError, ValueError):
+            archive = {"merged": [], "metrics": []}
+        merged = {family.name: family for family in map(Metric.from_dict, archive["metrics"])}
+        # Files folded in by an archiving run that died before deleting them
+        done = set(archive["merged"])
+        names = []
+        for path in paths:
+            name = os.path.basename(path)
+            if name not in done:
+                try:
+                    families = _read_families(path)
+                except (OSError, ValueError):
+                    continue
+                for family in families:
+                    if family.kind != "gauge":
+                        _add_family(merged, family)
+            names.append(name)
+        _write_json(archive_path, {
+            "merged": names, "metrics": [family.to_dict() for family in merged.values()],
+        })
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def merge_worker_files(directory: str) -> List[Metric]:
+    """
+    Sum of every running worker's file and of the archive of exited ones,
+    so counter and histogram totals never go down when a worker is
+    replaced.
+    """
+    me = _worker_id()
+    live, dead = [], []
+    for path in sorted(glob.glob(os.path.join(directory, "worker-*.json"))):
+        try:
+            worker = _file_worker(path)
+        except ValueError:
+            continue
+        # A file with our pid but another start time is a predecessor's
+        if _alive(worker[0]) and (worker[0] != me[0] or worker == me):
+            live.append(path)
+        else:
+            dead.append(path)
+    if dead:
+        _archive(directory, dead)
+    merged: Dict[str, Metric] = {}
+    try:
+        with open(os.path.join(directory, ARCHIVE_FILE)) as f:
+            for data in json.load(f)["metrics"]:
+                _add_family(merged, Metric.from_dict(data))
+    except (OSError, ValueError):
+        pass
+    for path in live:
+        try:
+            families = _read_families(path)
+        except (OSError, ValueError):
+            continue
+        for family in families:
+            _add_family(merged, family)
+    return list(merged.values())
+
+
+def clear_worker_files(directory: str) -> None:
+    for path in glob.glob(os.path.join(directory, "worker-*.json*")):
+        os.remove(path)
+    for path in glob.glob(os.path.join(directory, ARCHIVE_FILE + "*")):
+        os.remove(path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+
+def render(metrics: List[Metric]) -> str:
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(metric.samples.items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_format_labels(labels)} {value}")
+                continue
+            # Snapshots hold per-bucket counts; Prometheus buckets are cumulative
+            cumulative = 0
+            for bound, count in value["buckets"].items():
+                cumulative += count
+                lines.append(f"{metric.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    metrics = collect()
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if directory:
+        write_worker_file(directory, metrics)
+        metrics = merge_worker_files(directory)
+    return Response(render(metrics), media_type=CONTENT_TYPE)
+
+
+async def _flush_periodically(directory: str) -> None:
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_SECONDS)
+        write_worker_file(directory, collect())
+
+
+def start_flushing() -> Optional["asyncio.Task[None]"]:
+    """
+    Keep this worker's file in METRICS_MULTIPROCESS_DIR current, for the
+    scrapes other workers answer; None when not running multi-process.
+    """
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not settings.METRICS_ENABLED or not directory:
+        return None
+    write_worker_file(directory, collect())
+    return asyncio.create_task(_flush_periodically(directory))
+
+
+async def stop_flushing(task: Optional["asyncio.Task[None]"]) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    # Final numbers, so a replaced worker's requests still count
+    write_worker_file(settings.METRICS_MULTIPROCESS_DIR, collect())
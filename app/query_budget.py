@@ -0,0 +1,114 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RepeatedQueryError(RuntimeError):
+    """
+    Raised in strict mode when one statement shape repeats too often in a
+    request, which almost always means an N+1 lazy load.
+    """
+
+
+class QueryStats:
+    """
+    SQL statements and DB time of one request.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+        self._last_context: Any = None
+
+    def record(self, statement: str, context: Any, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        # insertmanyvalues runs one statement as several batches; count the
+        # shape once per statement so bulk inserts are not flagged
+        if context is not None and context is self._last_context:
+            return
+        self._last_context = context
+        # Parameters are bound separately, so the SQL text is the shape
+        self.shapes[statement] += 1
+        if settings.QUERY_BUDGET_STRICT and self.shapes[statement] >= settings.QUERY_REPEAT_LIMIT:
+            raise RepeatedQueryError(
+                f"Statement ran {self.shapes[statement]} times in one request "
+                f"(limit {settings.QUERY_REPEAT_LIMIT}): {statement}"
+            )
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.3f};desc="{self.count} queries"'
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    stats.record(statement, context, time.perf_counter() - started)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the SQL statements and DB time of every HTTP request.
+
+    Both are sent back in a ``Server-Timing`` header, and requests running
+    more than QUERY_BUDGET statements are logged with their most repeated
+    statement. Engine events cover every engine (primary, replicas, async).
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_timing(message: Any) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if stats.count > settings.QUERY_BUDGET:
+                shape, repeats = stats.shapes.most_common(1)[0]
+                logger.warning(
+                    "%s %s ran %d SQL statements (budget %d) in %.1f ms; "
+                    "most repeated (%dx): %s",
+                    scope["method"], scope["path"], stats.count, settings.QUERY_BUDGET,
+                    stats.duration * 1000, repeats, shape,
+                )
@@ -0,0 +1,53 @@
+import itertools
+import threading
+from typing import Any, Hashable, List, Optional
+
+from app.cache import LRUTTLCache
+from app.config import settings
+
+# Users who wrote recently; their reads stay on the primary until the entry
+# expires so they see their own changes despite replication lag
+recent_writers = LRUTTLCache(
+    maxsize=settings.REPLICA_STICKY_CACHE_SIZE,
+    ttl=settings.REPLICA_STICKY_SECONDS,
+)
+
+
+def mark_write(subject: Optional[Hashable]) -> None:
+    if subject is not None and settings.DATABASE_REPLICA_URLS:
+        recent_writers.set(subject, True)
+
+
+def is_sticky(subject: Optional[Hashable]) -> bool:
+    return subject is not None and recent_writers.get(subject) is not None
+
+
+class ReplicaRouter:
+    """
+    Picks the engine for a read-only session.
+
+    Reads go to one of ``replicas`` (round robin, or the one with the fewest
+    checked-out connections), or to ``primary`` when there are no replicas
+    or the caller wrote within the last REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, primary: Any, replicas: List[Any], strategy: str = "round_robin"):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self, subject: Optional[Hashable] = None) -> Any:
+        if not self.replicas or is_sticky(subject):
+            return self.primary
+        if self.strategy == "least_connections":
+            return min(self.replicas, key=_checked_out)
+        with self._lock:
+            index = next(self._counter) % len(self.replicas)
+        return self.replicas[index]
+
+
+def _checked_out(engine: Any) -> int:
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout is not None else 0
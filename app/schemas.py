@@ -12,6 +12,19 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[int] = None
+    exp: Optional[int] = None
+    is_active: Optional[bool] = None
+    is_superuser: Optional[bool] = None
+    ver: Optional[int] = None
+
+
+class UserPrincipal(BaseModel):
+    """
+    Authenticated user built from token claims, without the database row.
+    """
+    id: int
+    is_active: bool
+    is_superuser: bool
 
 
 # User schemas
@@ -63,6 +76,10 @@ class ItemUpdate(ItemBase):
     pass
 
 
+class ItemBulkUpdate(ItemUpdate):
+    id: int
+
+
 class ItemInDBBase(ItemBase):
     id: int
     title: str
@@ -80,3 +97,42 @@ class Item(ItemInDBBase):
 
 class ItemWithOwner(Item):
     owner: User
+
+
+class UserWithItems(User):
+    items: List[Item] = []
+
+
+class BulkItemResult(BaseModel):
+    """
+    Outcome for one entry of a bulk request; ``status`` is an HTTP status code.
+    """
+    id: Optional[int] = None
+    status: int
+    detail: Optional[str] = None
+    item: Optional[Item] = None
+
+
+def warm_up() -> None:
+    """
+    Validate and serialize a sample of the request and response schemas once.
+
+    Some validation steps load their data on first use (email addresses
+    load idna's Unicode tables), which would otherwise land on the first
+    request a worker serves.
+    """
+    now = datetime.utcnow()
+    user = {
+        "id": 1, "email": "warm-up@example.com", "username": "warm-up",
+        "is_active": True, "is_superuser": False, "created_at": now, "updated_at": now,
+    }
+    item = {"id": 1, "title": "warm-up", "description": "", "owner_id": 1,
+            "created_at": now, "updated_at": now}
+    UserCreate.model_validate({**user, "password": "warm-up"})
+    UserUpdate.model_validate({"email": user["email"], "password": "warm-up"})
+    ItemCreate.model_validate(item)
+    ItemBulkUpdate.model_validate(item)
+    UserWithItems.model_validate({**user, "items": [item]}).model_dump_json()
+    ItemWithOwner.model_validate({**item, "owner": user}).model_dump_json()
+    BulkItemResult.model_validate({"id": 1, "status": 200, "item": item}).model_dump_json()
+    Token(access_token="warm-up", token_type="bearer").model_dump_json()
@@ -0,0 +1,150 @@
+import re
+from typing import Any, List, Literal
+
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+from sqlalchemy.engine import Connection
+
+from app import models
+from app.config import settings
+
+# "text": ranked full-text match over title + description
+# "prefix": autocomplete, title words starting with the query
+SearchMode = Literal["text", "prefix"]
+
+# Text search configuration used by both the index and the queries
+SEARCH_CONFIG = "english"
+
+# Stored generated column, so ranking reads the vector instead of
+# re-parsing title and description for every candidate row
+ITEM_DOCUMENT = (
+    f"to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce(title, '') || ' ' || coalesce(description, ''))"
+)
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS ({ITEM_DOCUMENT}) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_items_search ON items USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_items_title_trgm ON items USING gin (title gin_trgm_ops)",
+]
+
+# External-content FTS5 table over items, kept in sync by triggers
+SQLITE_DDL = [
+    # prefix='2 3': indexed 2 and 3 character prefixes for autocomplete
+    "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("
+    "title, description, content='items', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN "
+    "INSERT INTO items_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO items_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+]
+
+items_fts = table("items_fts", column("rowid"), column("rank"))
+search_vector = literal_column("items.search_vector")
+
+
+def create_search_indexes(connection: Connection) -> None:
+    """
+    Create the search indexes if they are missing (idempotent, run by
+    init_db after create_all so existing databases get them too).
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        for ddl in POSTGRES_DDL:
+            connection.execute(text(ddl))
+    elif dialect == "sqlite":
+        existed = connection.scalar(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'"
+        ))
+        for ddl in SQLITE_DDL:
+            connection.execute(text(ddl))
+        if not existed:
+            # Index the rows that were there before the triggers
+            connection.execute(text("INSERT INTO items_fts(items_fts) VALUES ('rebuild')"))
+
+
+def _fts5_query(terms: List[str], prefix: bool) -> str:
+    # Terms are quoted so user input cannot inject FTS5 syntax
+    escaped = [term.replace('"', '""') for term in terms]
+    if prefix:
+        # Phrase on the title whose last word may be incomplete
+        return 'title : "' + " ".join(escaped) + '" *'
+    return " ".join(f'"{term}"' for term in escaped)
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_items_stmt(dialect: str, q: str, mode: SearchMode = "text", *criteria: Any) -> Any:
+    """
+    SELECT of items matching ``q`` and ``criteria``, best matches first.
+
+    PostgreSQL ranks a tsvector match with ts_rank and serves prefix
+    searches from the trigram index; SQLite uses FTS5 and bm25. Other
+    databases fall back to (unindexed) LIKE matching. Full-text ranking
+    only looks at the SEARCH_MAX_RANKED newest matches, so very common
+    terms do not rank the whole table.
+    """
+    Item = models.Item
+    terms = q.split()
+    cap = settings.SEARCH_MAX_RANKED
+    if dialect == "postgresql":
+        if mode == "prefix":
+            # Word-start regex; pg_trgm's GIN index serves regex matches
+            pattern = r"\m" + re.escape(" ".join(terms))
+            return (
+                select(Item)
+                .where(Item.title.op("~*")(pattern), *criteria)
+                .order_by(func.similarity(Item.title, q).desc(), Item.id)
+            )
+        query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"), q)
+        matches = [search_vector.op("@@")(query), *criteria]
+        if cap:
+            # The newest matches, like SQLite: a LIMIT without ORDER BY may
+            # return any rows and differ between runs
+            candidates = select(Item.id).where(*matches).order_by(Item.id.desc()).limit(cap)
+            matches = [Item.id.in_(candidates.scalar_subquery())]
+        return (
+            select(Item)
+            .where(*matches)
+            .order_by(func.ts_rank(search_vector, query).desc(), Item.id)
+        )
+    if dialect == "sqlite":
+        # bm25 is computed inside the subquery, for the capped candidates only
+        ranked = (
+            select(items_fts.c.rowid.label("id"), items_fts.c.rank.label("rank"))
+            .select_from(items_fts)
+            .where(literal_column("items_fts").match(_fts5_query(terms, mode == "prefix")))
+        )
+        if criteria:
+            ranked = ranked.join(Item, Item.id == items_fts.c.rowid).where(*criteria)
+        if cap:
+            ranked = ranked.order_by(items_fts.c.rowid.desc()).limit(cap)
+        ranked = ranked.subquery()
+        return (
+            select(Item)
+            .join(ranked, ranked.c.id == Item.id)
+            .order_by(ranked.c.rank, Item.id)
+        )
+    if mode == "prefix":
+        pattern = _like_escape(" ".join(terms)) + "%"
+        return select(Item).where(or_(
+            Item.title.ilike(pattern, escape="\\"),
+            Item.title.ilike("% " + pattern, escape="\\"),
+        ), *criteria).order_by(Item.title, Item.id)
+    return select(Item).where(*[
+        or_(
+            Item.title.ilike(f"%{_like_escape(term)}%", escape="\\"),
+            Item.description.ilike(f"%{_like_escape(term)}%", escape="\\"),
+        )
+        for term in terms
+    ], *criteria).order_by(Item.id)
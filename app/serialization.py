@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app import models, schemas
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    JSON-encode to bytes, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def copy_headers(source: Optional[Response], target: Response) -> Response:
+    # Returning a Response directly drops headers set on the injected one
+    if source is not None:
+        for key, value in source.headers.items():
+            if key not in ("content-length", "content-type"):
+                target.headers[key] = value
+    return target
+
+
+def encode_models(adapter: TypeAdapter, objs: Any) -> bytes:
+    """
+    Validate ORM objects against ``adapter`` once and encode them to JSON.
+    """
+    return adapter.dump_json(adapter.validate_python(objs, from_attributes=True))
+
+
+def json_body(body: bytes, response: Optional[Response] = None) -> Response:
+    return copy_headers(response, Response(body, media_type="application/json"))
+
+
+def render_models(adapter: TypeAdapter, objs: Any, response: Optional[Response] = None) -> Response:
+    """
+    Validate ORM objects against ``adapter`` once and encode them directly.
+
+    Used for responses whose shape differs from the route's response_model
+    (e.g. ``include=owner``); relationships must already be loaded.
+    """
+    return json_body(encode_models(adapter, objs), response)
+
+
+class RowSerializer:
+    """
+    Fast response path for one router's list endpoints.
+
+    When the router is listed in FAST_SERIALIZATION_ROUTERS the endpoint
+    selects plain columns instead of ORM entities and the Core rows are
+    encoded straight to JSON, skipping ORM hydration and FastAPI's
+    response_model validation. Otherwise the endpoint behaves as before.
+    ``columns`` must match the fields of the endpoint's response schema.
+    """
+
+    def __init__(self, router: str, model: Any, columns: Sequence[Any]):
+        self.router = router
+        self.model = model
+        self.columns = list(columns)
+
+    @property
+    def enabled(self) -> bool:
+        return self.router in settings.FAST_SERIALIZATION_ROUTERS
+
+    def select(self) -> Any:
+        if self.enabled:
+            return select(*self.columns)
+        return select(self.model)
+
+    def fetch(self, result: Any) -> List[Any]:
+        if self.enabled:
+            return result.all()
+        return result.scalars().all()
+
+    def render(self, rows: List[Any], response: Optional[Response] = None) -> Any:
+        if not self.enabled:
+            return rows
+        return copy_headers(response, FastJSONResponse([row._asdict() for row in rows]))
+
+
+# Public user fields; hashed_password and token_version never leave the API
+USER_COLUMNS = [
+    models.User.email,
+    models.User.username,
+    models.User.is_active,
+    models.User.is_superuser,
+    models.User.id,
+    models.User.created_at,
+    models.User.updated_at,
+]
+
+items = RowSerializer("items", models.Item, models.Item.__table__.columns)
+users = RowSerializer("users", models.User, USER_COLUMNS)
+
+# Single rows, encoded once and kept in the shared cache
+item = TypeAdapter(schemas.Item)
+user = TypeAdapter(schemas.User)
+
+# Shapes returned with ?include=...
+items_with_owner = TypeAdapter(List[schemas.ItemWithOwner])
+user_with_items = TypeAdapter(schemas.UserWithItems)
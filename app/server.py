@@ -0,0 +1,142 @@
+"""
+Production launcher: gunicorn managing uvicorn worker processes.
+
+    python -m app.server            # SERVER_* settings, see config.py
+    python -m app.server --reload   # one process, restarts on code changes
+    gunicorn app.main:app           # same options, from gunicorn.conf.py
+
+The master imports the app once (SERVER_PRELOAD) and forks the workers,
+which then share the imported code and module state copy-on-write instead
+of each importing it again. Each worker opens its own database
+connections after the fork. On SIGTERM the master stops accepting
+connections and gives in-flight requests SERVER_GRACEFUL_TIMEOUT_SECONDS
+to finish before the workers are killed.
+"""
+import gc
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict
+
+from app.config import settings
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:  # the worker uvicorn still bundles, deprecated there
+    from uvicorn.workers import UvicornWorker
+
+logger = logging.getLogger("gunicorn.error")
+
+APP = "app.main:app"
+
+
+class Worker(UvicornWorker):
+    # "auto" picks uvloop and httptools when they are installed and falls
+    # back to asyncio and h11 otherwise
+    CONFIG_KWARGS: Dict[str, Any] = {
+        "loop": "auto",
+        "http": "auto",
+        "lifespan": "on",
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+    }
+
+
+def worker_count() -> int:
+    return settings.SERVER_WORKERS or multiprocessing.cpu_count()
+
+
+def on_starting(server: Any) -> None:
+    # Workers write their metrics here for each other's scrapes; set before
+    # the fork, and in the environment for workers that import the app anew
+    from app import prometheus
+
+    if not settings.METRICS_ENABLED:
+        return
+    if settings.METRICS_MULTIPROCESS_DIR:
+        # Numbers of a previous run would add to this one's
+        prometheus.clear_worker_files(settings.METRICS_MULTIPROCESS_DIR)
+        return
+    directory = tempfile.mkdtemp(prefix="app-metrics-")
+    settings.METRICS_MULTIPROCESS_DIR = os.environ["METRICS_MULTIPROCESS_DIR"] = directory
+    server.metrics_dir_created = directory
+
+
+def on_exit(server: Any) -> None:
+    directory = getattr(server, "metrics_dir_created", None)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def when_ready(server: Any) -> None:
+    # Everything imported so far goes to the permanent generation, so the
+    # workers' garbage collections do not touch (and copy) those pages
+    gc.freeze()
+    logger.info(
+        "Serving %s on %s with %d workers (loop: %s, http: %s)",
+        APP, settings.SERVER_BIND, server.num_workers,
+        "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "httptools" if importlib.util.find_spec("httptools") else "h11",
+    )
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    # Connections the master opened while importing the app are shared
+    # with every worker through the fork; never use them from here
+    from app.database import dispose_engines
+
+    dispose_engines(close=False)
+
+
+def gunicorn_options() -> Dict[str, Any]:
+    """
+    gunicorn settings from SERVER_* settings, for gunicorn.conf.py and main().
+    """
+    return {
+        "bind": [settings.SERVER_BIND],
+        "workers": worker_count(),
+        "worker_class": f"{__name__}.Worker",
+        "keepalive": settings.SERVER_KEEPALIVE_SECONDS,
+        "backlog": settings.SERVER_BACKLOG,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "timeout": settings.SERVER_TIMEOUT_SECONDS,
+        "preload_app": settings.SERVER_PRELOAD,
+        "on_starting": on_starting,
+        "on_exit": on_exit,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+    }
+
+
+def main(argv: Any = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    host, _, port = settings.SERVER_BIND.rpartition(":")
+    if "--reload" in argv or sys.platform == "win32":
+        import uvicorn
+
+        # gunicorn needs fork; development and Windows get one uvicorn process
+        uvicorn.run(APP, host=host, port=int(port), reload="--reload" in argv)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in gunicorn_options().items():
+                self.cfg.set(key, value)
+
+        def load(self) -> Any:
+            from app.main import app
+
+            return app
+
+    Application().run()
+
+
+if __name__ == "__main__":
+    main()
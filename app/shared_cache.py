@@ -0,0 +1,509 @@
+import asyncio
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.cache import LRUTTLCache
+from app.config import settings
+
+# Left in place of an invalidated entry while read replicas may still serve
+# the old row, so a fill from a lagging replica cannot cache it again
+TOMBSTONE = b"\x00"
+
+# Generation tokens live this long; losing one (expiry or eviction) only
+# orphans the entries made under it
+GENERATION_TTL_SECONDS = 24 * 3600
+
+# Result of a fill that raised; requests waiting on it load for themselves
+_FAILED = object()
+
+# Compare-and-delete, so a fill lock that expired and was taken by another
+# worker is not released by the first one
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class CacheBackend:
+    """
+    Byte-string store with per-entry TTLs (seconds).
+
+    Subclasses implement the blocking methods; the ``*_async`` variants
+    call them by default, which suits backends that do no I/O. ``shared``
+    backends are seen by every worker process.
+    """
+
+    shared = False
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    def set_many(self, mapping: Mapping[str, bytes], ttl: float) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """
+        Set ``key`` only if it is absent; True if it was set.
+        """
+        raise NotImplementedError
+
+    def delete_many(self, keys: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def release(self, key: str, token: bytes) -> None:
+        """
+        Delete ``key`` if it still holds ``token``.
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[0]
+
+    async def get_many_async(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return self.get_many(keys)
+
+    async def set_many_async(self, mapping: Mapping[str, bytes], ttl: float) -> None:
+        self.set_many(mapping, ttl)
+
+    async def add_async(self, key: str, value: bytes, ttl: float) -> bool:
+        return self.add(key, value, ttl)
+
+    async def delete_many_async(self, keys: Sequence[str]) -> None:
+        self.delete_many(keys)
+
+    async def release_async(self, key: str, token: bytes) -> None:
+        self.release(key, token)
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        return (await self.get_many_async([key]))[0]
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Per-process LRU; other workers neither see its entries nor its
+    invalidations, so stale reads last up to the TTL there.
+    """
+
+    def __init__(self, maxsize: int):
+        # Every write passes its own TTL
+        self.entries = LRUTTLCache(maxsize=maxsize, ttl=float("inf"))
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [self.entries.get(key) for key in keys]
+
+    def set_many(self, mapping: Mapping[str, bytes], ttl: float) -> None:
+        for key, value in mapping.items():
+            self.entries.set(key, value, ttl)
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self.entries.get(key) is not None:
+                return False
+            self.entries.set(key, value, ttl)
+            return True
+
+    def delete_many(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            self.entries.delete(key)
+
+    def release(self, key: str, token: bytes) -> None:
+        with self._lock:
+            if self.entries.get(key) == token:
+                self.entries.delete(key)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Any Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly) via redis-py,
+    with a blocking client for sync handlers and an asyncio one for async
+    handlers. Invalidations delete exact keys, never SCAN the keyspace.
+
+    ``client`` / ``async_client`` replace the clients made from ``url``,
+    e.g. ``fakeredis.FakeRedis()`` and ``fakeredis.FakeAsyncRedis()``.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client: Any = None, async_client: Any = None):
+        if client is None:
+            # Imported here: redis-py is optional and slow to import, and
+            # only this backend needs it
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.url = url
+        self.client = client
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+        # Unless given, created on first use, inside the worker's event loop
+        self._async_client: Any = None
+        self._async_release: Any = None
+        if async_client is not None:
+            self._async_client = async_client
+            self._async_release = async_client.register_script(_RELEASE_SCRIPT)
+
+    @property
+    def async_client(self) -> Any:
+        if self._async_client is None:
+            import redis.asyncio as aioredis
+
+            self._async_client = aioredis.Redis.from_url(self.url)
+            self._async_release = self._async_client.register_script(_RELEASE_SCRIPT)
+        return self._async_client
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return self.client.mget(keys)
+
+    def set_many(self, mapping: Mapping[str, bytes], ttl: float) -> None:
+        with self.client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, px=int(ttl * 1000))
+            pipe.execute()
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(self.client.set(key, value, px=int(ttl * 1000), nx=True))
+
+    def delete_many(self, keys: Sequence[str]) -> None:
+        if keys:
+            self.client.unlink(*keys)
+
+    def release(self, key: str, token: bytes) -> None:
+        self._release(keys=[key], args=[token])
+
+    async def get_many_async(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return await self.async_client.mget(keys)
+
+    async def set_many_async(self, mapping: Mapping[str, bytes], ttl: float) -> None:
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, px=int(ttl * 1000))
+            await pipe.execute()
+
+    async def add_async(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(await self.async_client.set(key, value, px=int(ttl * 1000), nx=True))
+
+    async def delete_many_async(self, keys: Sequence[str]) -> None:
+        if keys:
+            await self.async_client.unlink(*keys)
+
+    async def release_async(self, key: str, token: bytes) -> None:
+        # Only called after add_async, so the async client exists
+        await self._async_release(keys=[key], args=[token])
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = _FAILED
+
+
+class SharedCache:
+    """
+    Cache-aside over a CacheBackend, with stampede protection.
+
+    ``get_or_load`` returns the cached bytes or runs ``loader`` (which
+    returns the bytes to cache, or None for "not found", which is not
+    cached). Concurrent misses for one key share a single load: within a
+    process through an in-flight table, across processes (shared backends)
+    through a short fill lock the other workers wait on.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend], prefix: str, ttl: float, lock_seconds: float):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, "asyncio.Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def key(self, *parts: Any) -> str:
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    def _lock_key(self, key: str) -> str:
+        return key + ":fill-lock"
+
+    @staticmethod
+    def _usable(value: Optional[bytes]) -> bool:
+        return value is not None and value != TOMBSTONE
+
+    # Every key lives in the namespace of its parent key ("app:user:5" for
+    # "app:user:5:self"). The stored key carries the namespace's current
+    # generation token, so invalidate_prefix drops a whole namespace by
+    # writing a new token: no SCAN, the orphaned entries just expire.
+
+    @staticmethod
+    def namespace(key: str) -> str:
+        return key.rpartition(":")[0]
+
+    @staticmethod
+    def _generation_keys(namespace: str) -> Tuple[str, str]:
+        # The token, and a marker that blocks refills while read replicas
+        # may still serve rows from before the last prefix invalidation
+        return namespace + "@gen", namespace + "@blocked"
+
+    @staticmethod
+    def _versioned(key: str, generation: bytes) -> str:
+        return key + "@" + generation.decode()
+
+    def _generations(self, namespaces: Sequence[str]) -> Dict[str, Tuple[bytes, bool]]:
+        """
+        Current token and blocked flag per namespace (one MGET); namespaces
+        without a token get a new one.
+        """
+        keys = [key for namespace in namespaces for key in self._generation_keys(namespace)]
+        values = self.backend.get_many(keys)
+        generations = {}
+        for i, namespace in enumerate(namespaces):
+            token, blocked = values[2 * i], values[2 * i + 1]
+            if token is None:
+                gen_key = self._generation_keys(namespace)[0]
+                token = uuid.uuid4().hex.encode()
+                # Another worker may have created it first; use theirs
+                if not self.backend.add(gen_key, token, GENERATION_TTL_SECONDS):
+                    token = self.backend.get(gen_key) or token
+            generations[namespace] = (token, blocked is not None)
+        return generations
+
+    async def _generations_async(self, namespaces: Sequence[str]) -> Dict[str, Tuple[bytes, bool]]:
+        keys = [key for namespace in namespaces for key in self._generation_keys(namespace)]
+        values = await self.backend.get_many_async(keys)
+        generations = {}
+        for i, namespace in enumerate(namespaces):
+            token, blocked = values[2 * i], values[2 * i + 1]
+            if token is None:
+                gen_key = self._generation_keys(namespace)[0]
+                token = uuid.uuid4().hex.encode()
+                if not await self.backend.add_async(gen_key, token, GENERATION_TTL_SECONDS):
+                    token = await self.backend.get_async(gen_key) or token
+            generations[namespace] = (token, blocked is not None)
+        return generations
+
+    def _versioned_keys(self, keys: Sequence[str], generations: Dict[str, Tuple[bytes, bool]]) -> List[str]:
+        return [self._versioned(key, generations[self.namespace(key)][0]) for key in keys]
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        namespace = self.namespace(key)
+        token, blocked = self._generations([namespace])[namespace]
+        key = self._versioned(key, token)
+        value = self.backend.get(key)
+        if self._usable(value):
+            self.hits += 1
+            return value
+        self.misses += 1
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.event.wait(self.lock_seconds)
+            if flight.value is not _FAILED:
+                return flight.value
+            return loader()
+        try:
+            flight.value = self._fill(key, loader, blocked)
+            return flight.value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def _fill(self, key: str, loader: Callable[[], Optional[bytes]], blocked: bool = False) -> Optional[bytes]:
+        token = None
+        if self.backend.shared:
+            token = uuid.uuid4().hex.encode()
+            if not self.backend.add(self._lock_key(key), token, self.lock_seconds):
+                token = None
+                # Another worker is filling this key; use its value if it
+                # arrives before the lock is released or expires
+                deadline = time.monotonic() + self.lock_seconds
+                while time.monotonic() < deadline:
+                    time.sleep(0.01)
+                    value, lock = self.backend.get_many([key, self._lock_key(key)])
+                    if self._usable(value):
+                        return value
+                    if lock is None:
+                        break
+        try:
+            value = loader()
+            if value is not None and not blocked:
+                # Only if absent: a tombstone written meanwhile wins
+                self.backend.add(key, value, self.ttl)
+            return value
+        finally:
+            if token is not None:
+                self.backend.release(self._lock_key(key), token)
+
+    async def get_or_load_async(
+        self, key: str, loader: Callable[[], Awaitable[Optional[bytes]]]
+    ) -> Optional[bytes]:
+        namespace = self.namespace(key)
+        token, blocked = (await self._generations_async([namespace]))[namespace]
+        key = self._versioned(key, token)
+        value = await self.backend.get_async(key)
+        if self._usable(value):
+            self.hits += 1
+            return value
+        self.misses += 1
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            try:
+                value = await asyncio.wait_for(asyncio.shield(flight), self.lock_seconds)
+            except asyncio.TimeoutError:
+                value = _FAILED
+            if value is not _FAILED:
+                return value
+            return await loader()
+        flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        value = _FAILED
+        try:
+            value = await self._fill_async(key, loader, blocked)
+            return value
+        finally:
+            self._async_flights.pop(key, None)
+            flight.set_result(value)
+
+    async def _fill_async(
+        self, key: str, loader: Callable[[], Awaitable[Optional[bytes]]], blocked: bool = False
+    ) -> Optional[bytes]:
+        token = None
+        if self.backend.shared:
+            token = uuid.uuid4().hex.encode()
+            if not await self.backend.add_async(self._lock_key(key), token, self.lock_seconds):
+                token = None
+                deadline = time.monotonic() + self.lock_seconds
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+                    value, lock = await self.backend.get_many_async([key, self._lock_key(key)])
+                    if self._usable(value):
+                        return value
+                    if lock is None:
+                        break
+        try:
+            value = await loader()
+            if value is not None and not blocked:
+                await self.backend.add_async(key, value, self.ttl)
+            return value
+        finally:
+            if token is not None:
+                await self.backend.release_async(self._lock_key(key), token)
+
+    @staticmethod
+    def _replication_window() -> float:
+        # With replicas, a request that misses right after the write may
+        # still read the old row; block refills for the replication window
+        if settings.DATABASE_REPLICA_URLS and settings.REPLICA_STICKY_SECONDS > 0:
+            return settings.REPLICA_STICKY_SECONDS
+        return 0
+
+    def invalidate(self, *keys: str) -> None:
+        if not self.enabled or not keys:
+            return
+        generations = self._generations(list(dict.fromkeys(map(self.namespace, keys))))
+        keys = self._versioned_keys(keys, generations)
+        window = self._replication_window()
+        if window:
+            self.backend.set_many({key: TOMBSTONE for key in keys}, window)
+        else:
+            self.backend.delete_many(keys)
+
+    async def invalidate_async(self, *keys: str) -> None:
+        if not self.enabled or not keys:
+            return
+        generations = await self._generations_async(list(dict.fromkeys(map(self.namespace, keys))))
+        keys = self._versioned_keys(keys, generations)
+        window = self._replication_window()
+        if window:
+            await self.backend.set_many_async({key: TOMBSTONE for key in keys}, window)
+        else:
+            await self.backend.delete_many_async(keys)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """
+        Drop every key directly under ``prefix`` (a key without its last
+        part, e.g. user_prefix(id)) by giving it a new generation.
+        """
+        if not self.enabled:
+            return
+        gen_key, blocked_key = self._generation_keys(prefix)
+        window = self._replication_window()
+        # Blocked first, so no request fills the new generation from a replica
+        if window:
+            self.backend.set_many({blocked_key: TOMBSTONE}, window)
+        self.backend.set_many({gen_key: uuid.uuid4().hex.encode()}, GENERATION_TTL_SECONDS)
+
+    async def invalidate_prefix_async(self, prefix: str) -> None:
+        if not self.enabled:
+            return
+        gen_key, blocked_key = self._generation_keys(prefix)
+        window = self._replication_window()
+        if window:
+            await self.backend.set_many_async({blocked_key: TOMBSTONE}, window)
+        await self.backend.set_many_async({gen_key: uuid.uuid4().hex.encode()}, GENERATION_TTL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def create_backend() -> Optional[CacheBackend]:
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryBackend(settings.CACHE_MEMORY_SIZE)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend(settings.CACHE_URL or "redis://localhost:6379/0")
+    return None
+
+
+cache = SharedCache(
+    create_backend(),
+    prefix=settings.CACHE_KEY_PREFIX,
+    ttl=settings.CACHE_TTL_SECONDS,
+    lock_seconds=settings.CACHE_LOCK_SECONDS,
+)
+
+
+# Keys of the cached reads. A user's variants share the "user:<id>" prefix,
+# so one prefix invalidation drops them all.
+
+def item_key(id: int) -> str:
+    return cache.key("item", id)
+
+
+def user_key(id: int, include: Optional[str] = None) -> str:
+    return cache.key("user", id, include or "self")
+
+
+def user_prefix(id: int) -> str:
+    """
+    Prefix of every cached variant of a user's entry, to drop after the
+    user changed.
+    """
+    return cache.key("user", id)
+
+
+def item_keys(items: Sequence[Any]) -> List[str]:
+    """
+    Keys to drop after ``items`` were written: each item and its owner's
+    ``include=items`` entry.
+    """
+    keys: Dict[str, None] = {}
+    for item in items:
+        keys[item_key(item.id)] = None
+        keys[user_key(item.owner_id, "items")] = None
+    return list(keys)
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from app import auth, database, prometheus, schemas
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up() -> None:
+    """
+    Load what the first requests would otherwise pay for: the schemas'
+    lazily loaded validation data, the dummy password hash for unknown-user
+    logins and DB_POOL_WARM_CONNECTIONS connections per engine.
+    """
+    schemas.warm_up()
+    await auth.dummy_password_hash_async()
+    if settings.DB_POOL_WARM_CONNECTIONS > 0:
+        await asyncio.to_thread(database.warm_pools, settings.DB_POOL_WARM_CONNECTIONS)
+        await database.warm_async_pools(settings.DB_POOL_WARM_CONNECTIONS)
+
+
+@asynccontextmanager
+async def lifespan(app: Any) -> AsyncIterator[None]:
+    started = time.perf_counter()
+    if settings.DB_INIT_ON_STARTUP:
+        await asyncio.to_thread(database.init_db)
+    # A slow or unreachable database must not keep the worker from
+    # starting; requests then connect on demand as usual
+    try:
+        await asyncio.wait_for(warm_up(), settings.STARTUP_WARM_UP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "Startup warm-up did not finish within %.1fs, serving without it",
+            settings.STARTUP_WARM_UP_TIMEOUT_SECONDS,
+        )
+    except Exception:
+        logger.warning("Startup warm-up failed, serving without it", exc_info=True)
+    logger.info("Startup took %.0f ms", (time.perf_counter() - started) * 1000)
+    flusher = prometheus.start_flushing()
+    yield
+    await prometheus.stop_flushing(flusher)
+    await database.dispose_async_engines()
@@ -0,0 +1,329 @@
+"""
+Compact JWS tokens (JWT with a signature, compact serialization).
+
+Signing keys are named by a ``kid`` that every token carries in its header,
+so keys can be rotated: new tokens are signed with JWT_ACTIVE_KID and
+tokens signed with any other key still in JWT_KEYS verify until they
+expire. The algorithm follows from the key: a secret is HS256, a P-256 PEM
+key ES256 and an Ed25519 PEM key EdDSA. With the asymmetric ones, services
+that only hold the public keys (served at /.well-known/jwks.json) can
+verify tokens without being able to issue them.
+
+HS256 keys keep a keyed HMAC state that is copied per token instead of
+re-keyed, and each key's header segment is encoded once. ES256 and EdDSA
+use ``cryptography`` when it is installed, and otherwise the pure-Python
+``ecdsa`` package, which is much slower.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.serialization import dumps, loads
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization as pem
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    from cryptography.hazmat.primitives.asymmetric.utils import (
+        decode_dss_signature,
+        encode_dss_signature,
+    )
+except ImportError:  # pragma: no cover - cryptography is optional
+    pem = None
+
+# Tokens issued without a kid header are checked against this key
+DEFAULT_KID = "default"
+
+
+class TokenError(Exception):
+    """
+    The token is malformed, expired, or not signed by a known key.
+    """
+
+
+def b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def b64decode(data: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        raise TokenError("Invalid base64 segment")
+
+
+class HMACKey:
+    """
+    HS256 with a shared secret.
+    """
+
+    alg = "HS256"
+    can_sign = True
+
+    def __init__(self, secret: bytes):
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def sign(self, message: bytes) -> bytes:
+        # Copying the keyed state skips hashing the padded key per token
+        mac = self._hmac.copy()
+        mac.update(message)
+        return mac.digest()
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(self.sign(message), signature)
+
+    def public_jwk(self) -> Optional[Dict[str, str]]:
+        return None
+
+
+class _CryptographyKey:
+    """
+    ES256 or EdDSA through ``cryptography``; verify-only for public keys.
+    """
+
+    def __init__(self, key: Any):
+        if isinstance(key, (ec.EllipticCurvePrivateKey, ed25519.Ed25519PrivateKey)):
+            self._private: Any = key
+            key = key.public_key()
+        else:
+            self._private = None
+        self._public = key
+        if isinstance(key, ed25519.Ed25519PublicKey):
+            self.alg = "EdDSA"
+        elif isinstance(key, ec.EllipticCurvePublicKey) and key.curve.name == "secp256r1":
+            self.alg = "ES256"
+        else:
+            raise ValueError("Only P-256 (ES256) and Ed25519 (EdDSA) keys are supported")
+
+    @property
+    def can_sign(self) -> bool:
+        return self._private is not None
+
+    def sign(self, message: bytes) -> bytes:
+        if self.alg == "EdDSA":
+            return self._private.sign(message)
+        # JWS wants the raw r || s, not DER
+        r, s = decode_dss_signature(self._private.sign(message, ec.ECDSA(hashes.SHA256())))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        try:
+            if self.alg == "EdDSA":
+                self._public.verify(signature, message)
+            else:
+                if len(signature) != 64:
+                    return False
+                der = encode_dss_signature(
+                    int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big")
+                )
+                self._public.verify(der, message, ec.ECDSA(hashes.SHA256()))
+        except InvalidSignature:
+            return False
+        return True
+
+    def public_jwk(self) -> Optional[Dict[str, str]]:
+        if self.alg == "EdDSA":
+            raw = self._public.public_bytes(pem.Encoding.Raw, pem.PublicFormat.Raw)
+            return {"kty": "OKP", "crv": "Ed25519", "x": b64encode(raw).decode()}
+        numbers = self._public.public_numbers()
+        return {
+            "kty": "EC", "crv": "P-256",
+            "x": b64encode(numbers.x.to_bytes(32, "big")).decode(),
+            "y": b64encode(numbers.y.to_bytes(32, "big")).decode(),
+        }
+
+
+class _EcdsaKey:
+    """
+    ES256 or EdDSA through the pure-Python ``ecdsa`` package.
+    """
+
+    def __init__(self, material: str):
+        import ecdsa
+
+        if "PRIVATE KEY" in material:
+            self._private: Any = ecdsa.SigningKey.from_pem(material)
+            self._public = self._private.verifying_key
+        else:
+            self._private = None
+            self._public = ecdsa.VerifyingKey.from_pem(material)
+        if self._public.curve == ecdsa.Ed25519:
+            self.alg = "EdDSA"
+            self._hashfunc: Any = None
+        elif self._public.curve == ecdsa.NIST256p:
+            self.alg = "ES256"
+            self._hashfunc = hashlib.sha256
+        else:
+            raise ValueError("Only P-256 (ES256) and Ed25519 (EdDSA) keys are supported")
+        self._bad_signature = ecdsa.BadSignatureError
+        # Point multiplication tables make verification 2-3x faster; ecdsa
+        # can only build them for keys derived from a private key
+        if self._private is not None:
+            self._public.precompute()
+
+    @property
+    def can_sign(self) -> bool:
+        return self._private is not None
+
+    def sign(self, message: bytes) -> bytes:
+        if self._hashfunc is None:
+            return self._private.sign(message)
+        # RFC 6979 nonces: no dependence on the random number generator
+        return self._private.sign_deterministic(message, hashfunc=self._hashfunc)
+
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        try:
+            if self._hashfunc is None:
+                return self._public.verify(signature, message)
+            return self._public.verify(signature, message, hashfunc=self._hashfunc)
+        except (self._bad_signature, ValueError, AssertionError):
+            return False
+
+    def public_jwk(self) -> Optional[Dict[str, str]]:
+        raw = self._public.to_string()
+        if self.alg == "EdDSA":
+            return {"kty": "OKP", "crv": "Ed25519", "x": b64encode(raw).decode()}
+        return {
+            "kty": "EC", "crv": "P-256",
+            "x": b64encode(raw[:32]).decode(), "y": b64encode(raw[32:]).decode(),
+        }
+
+
+def load_key(material: str) -> Any:
+    """
+    Key for a JWT_KEYS value: a PEM private or public key, else a secret.
+    """
+    if not material.lstrip().startswith("-----BEGIN"):
+        return HMACKey(material.encode())
+    if pem is None:
+        return _EcdsaKey(material)
+    if "PRIVATE KEY" in material:
+        return _CryptographyKey(pem.load_pem_private_key(material.encode(), password=None))
+    return _CryptographyKey(pem.load_pem_public_key(material.encode()))
+
+
+def generate_private_key(alg: str) -> str:
+    """
+    New PKCS#8 PEM private key for ES256 or EdDSA.
+    """
+    if alg not in ("ES256", "EdDSA"):
+        raise ValueError(f"No key pair for {alg}")
+    if pem is not None:
+        key = ec.generate_private_key(ec.SECP256R1()) if alg == "ES256" else ed25519.Ed25519PrivateKey.generate()
+        return key.private_bytes(
+            pem.Encoding.PEM, pem.PrivateFormat.PKCS8, pem.NoEncryption()
+        ).decode()
+    import ecdsa
+
+    curve = ecdsa.NIST256p if alg == "ES256" else ecdsa.Ed25519
+    return ecdsa.SigningKey.generate(curve=curve).to_pem(format="pkcs8").decode()
+
+
+@lru_cache(maxsize=64)
+def _parse_header(segment: str) -> Dict[str, Any]:
+    # Tokens signed by the same key share their header segment; caching
+    # only valid ones keeps garbage from filling the cache
+    try:
+        header = loads(b64decode(segment))
+    except ValueError:
+        raise TokenError("Invalid header")
+    if not isinstance(header, dict):
+        raise TokenError("Invalid header")
+    return header
+
+
+def unverified_claims(token: str) -> Dict[str, Any]:
+    """
+    The payload without checking the signature; only for routing decisions.
+    """
+    try:
+        _, payload, _ = token.split(".")
+        claims = loads(b64decode(payload))
+    except ValueError:
+        raise TokenError("Malformed token")
+    if not isinstance(claims, dict):
+        raise TokenError("Malformed token")
+    return claims
+
+
+class TokenCodec:
+    """
+    Encodes claims with the active key and decodes tokens signed with any
+    of the keys.
+    """
+
+    def __init__(self, keys: Dict[str, Any], active_kid: str):
+        if active_kid not in keys:
+            raise ValueError(f"JWT_ACTIVE_KID {active_kid!r} is not in JWT_KEYS")
+        self.keys = keys
+        self.active_kid = active_kid
+        self.active_key = keys[active_kid]
+        if not self.active_key.can_sign:
+            raise ValueError(f"Key {active_kid!r} is a public key and cannot sign")
+        self._header = b64encode(
+            dumps({"alg": self.active_key.alg, "typ": "JWT", "kid": active_kid})
+        ) + b"."
+
+    @property
+    def algorithm(self) -> str:
+        return self.active_key.alg
+
+    def encode(self, claims: Dict[str, Any]) -> str:
+        signing_input = self._header + b64encode(dumps(claims))
+        return (signing_input + b"." + b64encode(self.active_key.sign(signing_input))).decode()
+
+    def decode(self, token: str, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Verified claims; raises TokenError unless the signature matches the
+        key named by ``kid`` and ``exp`` (required) is in the future.
+        """
+        try:
+            header_segment, payload_segment, signature_segment = token.split(".")
+        except ValueError:
+            raise TokenError("Malformed token")
+        header = _parse_header(header_segment)
+        kid, alg = header.get("kid", DEFAULT_KID), header.get("alg")
+        if not isinstance(kid, str) or not isinstance(alg, str):
+            raise TokenError("Unknown signing key")
+        key = self.keys.get(kid)
+        # The key decides the algorithm; the header only has to agree, so a
+        # token cannot pick e.g. HS256 with a public key as the secret
+        if key is None or alg != key.alg:
+            raise TokenError("Unknown signing key")
+        signing_input = f"{header_segment}.{payload_segment}".encode("ascii", "replace")
+        if not key.verify(signing_input, b64decode(signature_segment)):
+            raise TokenError("Signature verification failed")
+        try:
+            claims = loads(b64decode(payload_segment))
+        except ValueError:
+            raise TokenError("Invalid payload")
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload")
+        exp = claims.get("exp")
+        if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+            raise TokenError("Missing or invalid exp")
+        if exp < (time.time() if now is None else now):
+            raise TokenError("Token has expired")
+        return claims
+
+    def jwks(self) -> Dict[str, Any]:
+        """
+        JSON Web Key Set of the public keys; shared secrets are never listed.
+        """
+        keys = []
+        for kid, key in self.keys.items():
+            jwk = key.public_jwk()
+            if jwk is not None:
+                keys.append({**jwk, "kid": kid, "alg": key.alg, "use": "sig"})
+        return {"keys": keys}
+
+
+def codec_from_settings() -> TokenCodec:
+    materials = settings.JWT_KEYS or {DEFAULT_KID: settings.SECRET_KEY}
+    keys = {kid: load_key(material) for kid, material in materials.items()}
+    return TokenCodec(keys, settings.JWT_ACTIVE_KID or next(iter(materials)))
@@ -0,0 +1,373 @@
+"""
+Load test of the API hot paths, with the app running in process.
+
+    python -m benchmarks.api [--users N] [--items M] [--concurrency C]
+                             [--seconds S] [--database-url URL]
+                             [--output report.json] [--baseline old.json]
+
+Seeds ``--users`` users (100 by default) and ``--items`` items (10,000)
+spread over them into a throwaway database, then drives each scenario in
+turn for ``--seconds`` (10) with ``--concurrency`` (16) concurrent clients
+through an async HTTP client talking to the ASGI app directly:
+
+    login           POST /users/login/access-token
+    read_items      GET /items/, following X-Next-Cursor page after page
+    read_item       GET /items/{id} of one of the client's own items
+    create_item     POST /items/
+    update_user_me  PUT /users/me, changing the email
+
+The database is a temporary SQLite file by default. A PostgreSQL URL
+names the server to use: a new database is created on it for the run and
+dropped afterwards, so the one in the URL is not touched.
+
+The report (JSON, on stdout or in ``--output``) has p50/p95/p99 latency,
+requests per second, status codes and SQL statements per request (from the
+Server-Timing header) per scenario, plus the commit, machine, database and
+settings the numbers were taken with. The workload is seeded, so two runs
+with the same options on the same machine are comparable across commits:
+``--baseline`` prints the change against an earlier report. Settings come
+from the environment as usual; logins pay for the full password hash, so
+BCRYPT_ROUNDS decides their throughput.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+PASSWORD = "benchmark-password"
+PAGE_SIZE = 20
+BATCH = 5000
+WARM_UP_SECONDS = 1.0
+SEED = 0
+
+# Settings that change what is measured, recorded with every report
+REPORTED_SETTINGS = [
+    "ASYNC_ROUTERS", "FAST_SERIALIZATION_ROUTERS", "CACHE_BACKEND", "AUTH_STATELESS",
+    "PASSWORD_SCHEMES", "BCRYPT_ROUNDS", "HASH_POOL_WORKERS", "DB_POOL_SIZE",
+    "DB_MAX_OVERFLOW", "DB_POOL_LIVENESS", "QUERY_STATS_ENABLED",
+]
+
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+@contextlib.contextmanager
+def disposable_database(url: str) -> Iterator[str]:
+    """
+    URL of an empty database for one run, removed afterwards.
+    """
+    if not url:
+        path = os.path.join(tempfile.gettempdir(), f"api-benchmark-{uuid.uuid4().hex[:8]}.db")
+        try:
+            yield "sqlite:///" + path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+
+    server = make_url(url)
+    if server.get_backend_name() != "postgresql":
+        raise SystemExit("--database-url must be a PostgreSQL URL (SQLite is the default)")
+    name = f"api_benchmark_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(server, isolation_level="AUTOCOMMIT")
+    with admin.connect() as connection:
+        connection.exec_driver_sql(f'CREATE DATABASE "{name}"')
+    try:
+        yield server.set(database=name).render_as_string(hide_password=False)
+    finally:
+        with admin.connect() as connection:
+            # The app's pools still hold connections to it
+            connection.exec_driver_sql(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        admin.dispose()
+
+
+def seed(users: int, items: int) -> Dict[int, List[int]]:
+    """
+    Insert ``users`` users sharing one password and ``items`` items dealt
+    round-robin to them; returns each user's item ids.
+    """
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.auth import get_password_hash
+    from app.database import engine, init_db
+
+    init_db()
+    # One hash for everyone: seeding should not take users * hash time
+    hashed_password = get_password_hash(PASSWORD)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"email": f"user{n}@example.com", "username": f"user{n}",
+             "hashed_password": hashed_password}
+            for n in range(users)
+        ])
+        user_ids = connection.scalars(select(models.User.id).order_by(models.User.id)).all()
+    for offset in range(0, items, BATCH):
+        with engine.begin() as connection:
+            connection.execute(insert(models.Item), [
+                {"title": f"Item {n}", "description": f"Benchmark item number {n}",
+                 "owner_id": user_ids[n % users]}
+                for n in range(offset, min(offset + BATCH, items))
+            ])
+    owned: Dict[int, List[int]] = {user_id: [] for user_id in user_ids}
+    with engine.connect() as connection:
+        for item_id, owner_id in connection.execute(select(models.Item.id, models.Item.owner_id)):
+            owned[owner_id].append(item_id)
+    return owned
+
+
+@dataclass
+class VirtualUser:
+    number: int
+    id: int
+    item_ids: List[int]
+    headers: Dict[str, str] = field(default_factory=dict)
+    cursor: Optional[str] = None
+    writes: int = 0
+
+
+@dataclass
+class Sample:
+    latency: float
+    status: int
+    statements: Optional[int]
+    db_ms: Optional[float]
+
+
+Scenario = Callable[[Any, VirtualUser, random.Random], Awaitable[Any]]
+
+
+def scenarios(prefix: str) -> Dict[str, Scenario]:
+    async def login(http: Any, user: VirtualUser, rng: random.Random) -> Any:
+        return await http.post(f"{prefix}/users/login/access-token", data={
+            "username": f"user{user.number}", "password": PASSWORD,
+        })
+
+    async def read_items(http: Any, user: VirtualUser, rng: random.Random) -> Any:
+        params: Dict[str, Any] = {"limit": PAGE_SIZE}
+        if user.cursor:
+            params["cursor"] = user.cursor
+        response = await http.get(f"{prefix}/items/", params=params, headers=user.headers)
+        # Start over from the first page after the last one
+        user.cursor = response.headers.get("x-next-cursor")
+        return response
+
+    async def read_item(http: Any, user: VirtualUser, rng: random.Random) -> Any:
+        item_id = rng.choice(user.item_ids)
+        return await http.get(f"{prefix}/items/{item_id}", headers=user.headers)
+
+    async def create_item(http: Any, user: VirtualUser, rng: random.Random) -> Any:
+        return await http.post(f"{prefix}/items/", headers=user.headers, json={
+            "title": f"Created {rng.random()}", "description": "Created by the benchmark",
+        })
+
+    async def update_user_me(http: Any, user: VirtualUser, rng: random.Random) -> Any:
+        user.writes += 1
+        return await http.put(f"{prefix}/users/me", headers=user.headers, json={
+            "email": f"user{user.number}.{user.writes}@example.com",
+        })
+
+    return {
+        "login": login,
+        "read_items": read_items,
+        "read_item": read_item,
+        "create_item": create_item,
+        "update_user_me": update_user_me,
+    }
+
+
+async def drive(http: Any, scenario: Scenario, users: List[VirtualUser],
+                concurrency: int, seconds: float) -> List[Sample]:
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(index: int) -> None:
+        rng = random.Random(SEED + index)
+        # Every client acts as its own user while there are enough users
+        user = users[index % len(users)]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await scenario(http, user, rng)
+            latency = time.perf_counter() - started
+            timing = _SERVER_TIMING.search(response.headers.get("server-timing", ""))
+            samples.append(Sample(
+                latency, response.status_code,
+                int(timing.group(2)) if timing else None,
+                float(timing.group(1)) if timing else None,
+            ))
+
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    return samples
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(samples: List[Sample], seconds: float) -> Dict[str, Any]:
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    statements = sorted(sample.statements for sample in samples if sample.statements is not None)
+    db_ms = [sample.db_ms for sample in samples if sample.db_ms is not None]
+    summary: Dict[str, Any] = {
+        "requests": len(samples),
+        "rps": round(len(samples) / seconds, 2),
+        "status": {str(code): count for code, count in sorted(Counter(s.status for s in samples).items())},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(statistics.fmean(latencies), 3),
+            "max": round(latencies[-1], 3),
+        } if latencies else None,
+    }
+    if statements:
+        summary["db_statements"] = {
+            "mean": round(statistics.fmean(statements), 2),
+            "p95": percentile(statements, 0.95),
+            "max": statements[-1],
+        }
+        summary["db_ms_mean"] = round(statistics.fmean(db_ms), 3)
+    return summary
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+
+
+def environment(dialect: str, options: argparse.Namespace) -> Dict[str, Any]:
+    from app.config import settings
+
+    return {
+        **git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": dialect,
+        "options": {
+            "users": options.users, "items": options.items,
+            "concurrency": options.concurrency, "seconds": options.seconds,
+            "page_size": PAGE_SIZE, "seed": SEED,
+        },
+        "settings": {name: getattr(settings, name) for name in REPORTED_SETTINGS},
+    }
+
+
+def print_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    def change(new: float, old: Optional[float]) -> str:
+        if not old:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    for name, result in report["scenarios"].items():
+        before = (baseline or {}).get("scenarios", {}).get(name, {})
+        latency = result["latency_ms"] or {}
+        old_latency = before.get("latency_ms") or {}
+        statements = result.get("db_statements", {}).get("mean")
+        print(
+            f"{name:15} {result['rps']:9.1f} req/s{change(result['rps'], before.get('rps')):8}"
+            f"  p50 {latency.get('p50', 0):8.2f}  p95 {latency.get('p95', 0):8.2f}"
+            f"{change(latency.get('p95', 0), old_latency.get('p95')):8}"
+            f"  p99 {latency.get('p99', 0):8.2f} ms"
+            f"  {statements if statements is not None else '-':>5} stmts"
+            f"  {result['status']}",
+            file=sys.stderr,
+        )
+    if baseline is not None:
+        ours, theirs = report["environment"], baseline.get("environment", {})
+        for key in ("database", "cpus", "options", "settings"):
+            if ours.get(key) != theirs.get(key):
+                print(f"note: {key} differs from the baseline's", file=sys.stderr)
+
+
+async def run(options: argparse.Namespace, owned: Dict[int, List[int]]) -> Dict[str, Tuple[List[Sample], float]]:
+    import httpx
+
+    from app.config import settings
+    from app.main import app
+
+    users = [
+        VirtualUser(number, user_id, item_ids)
+        for number, (user_id, item_ids) in enumerate(sorted(owned.items()))
+    ]
+    transport = httpx.ASGITransport(app=app)
+    results: Dict[str, Tuple[List[Sample], float]] = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+            table = scenarios(settings.API_V1_STR)
+            # Tokens for every user first; not part of any measurement
+            for user in users[:options.concurrency]:
+                response = await table["login"](http, user, random.Random(SEED))
+                response.raise_for_status()
+                user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for name in options.scenarios:
+                print(f"running {name} ...", file=sys.stderr)
+                await drive(http, table[name], users, options.concurrency, WARM_UP_SECONDS)
+                for user in users:
+                    user.cursor = None
+                samples = await drive(http, table[name], users, options.concurrency, options.seconds)
+                results[name] = (samples, options.seconds)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.api")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0, help="per scenario")
+    parser.add_argument("--database-url", default="", help="PostgreSQL server to create a throwaway database on")
+    parser.add_argument("--scenarios", nargs="+", default=list(scenarios("")), choices=list(scenarios("")))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare with")
+    options = parser.parse_args()
+    if options.items < options.users:
+        parser.error("--items must be at least --users, every user reads its own items")
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+    with disposable_database(options.database_url) as url:
+        # Before the app is imported: the engines are created at import time
+        os.environ["DATABASE_URL"] = url
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        from app.database import engine
+
+        print(f"seeding {options.users} users and {options.items} items ...", file=sys.stderr)
+        owned = seed(options.users, options.items)
+        results = asyncio.run(run(options, owned))
+        report = {
+            "environment": environment(engine.dialect.name, options),
+            "scenarios": {name: summarize(*result) for name, result in results.items()},
+        }
+
+    print_table(report, baseline)
+    encoded = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(encoded + "\n")
+    else:
+        print(encoded)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Login throughput under a mix of valid and invalid attempts.
+
+    python -m benchmarks.login [seconds] [attackers]
+
+Legitimate clients log in with the right password while ``attackers``
+threads (4 by default), each from its own client IP, keep trying wrong
+passwords for existing accounts and usernames that do not exist. Every
+scenario runs for ``seconds`` (10 by default) once with the failed-login
+limiter disabled and once with it enabled, against a temporary SQLite
+database, and reports throughput, latency and status codes per kind of
+attempt. With the limiter on, attackers should mostly get cheap 429s and
+the hash pool should be left to the legitimate logins. Settings come from
+the environment as usual; on slow hardware lower LOGIN_MAX_FAILURES_PER_*
+so the limits are reached within the run.
+"""
+import os
+import tempfile
+
+# Before the app is imported: the engine is created at import time
+_DB = os.path.join(tempfile.gettempdir(), "login-benchmark.db")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + _DB)
+
+import random  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from collections import Counter, defaultdict  # noqa: E402
+from typing import Any, Dict, List  # noqa: E402
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.auth import login_limiter  # noqa: E402
+from app.config import settings  # noqa: E402
+
+USERS = 20
+LEGITIMATE_CLIENTS = 4
+PASSWORD = "correct horse battery staple"
+LOGIN_PATH = f"{settings.API_V1_STR}/users/login/access-token"
+
+
+def from_address(app: Any, host: str) -> Any:
+    # TestClient always reports the same client address; give each
+    # simulated client its own so the per-IP limit applies per client
+    async def wrapped(scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] == "http":
+            scope = {**scope, "client": (host, 50000)}
+        await app(scope, receive, send)
+
+    return wrapped
+
+
+def setup(app: Any) -> None:
+    from app.database import engine, init_db
+
+    if os.path.exists(_DB):
+        os.remove(_DB)
+        # Pooled connections still point at the removed file
+        engine.dispose()
+    init_db()
+    with TestClient(app) as client:
+        for n in range(USERS):
+            response = client.post(f"{settings.API_V1_STR}/users/", json={
+                "email": f"user{n}@example.com", "username": f"user{n}", "password": PASSWORD,
+            })
+            response.raise_for_status()
+
+
+def attempt(kind: str, rng: random.Random) -> Dict[str, str]:
+    # Attackers guess at the second half of the accounts, so the
+    # per-account limit does not lock out the legitimate clients' accounts
+    if kind == "valid":
+        n = rng.randrange(USERS // 2)
+        return {"username": rng.choice([f"user{n}", f"user{n}@example.com"]), "password": PASSWORD}
+    if kind == "wrong password":
+        n = rng.randrange(USERS // 2, USERS)
+        return {"username": f"user{n}", "password": f"guess-{rng.random()}"}
+    return {"username": f"nobody{rng.randrange(10 ** 6)}", "password": PASSWORD}
+
+
+def client_loop(app: Any, host: str, kinds: List[str], deadline: float,
+                results: Dict[str, List[Any]], lock: threading.Lock) -> None:
+    rng = random.Random(host)
+    with TestClient(from_address(app, host)) as client:
+        while time.perf_counter() < deadline:
+            kind = rng.choice(kinds)
+            started = time.perf_counter()
+            response = client.post(LOGIN_PATH, data=attempt(kind, rng))
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results[kind].append((elapsed, response.status_code))
+
+
+def scenario(app: Any, seconds: float, attackers: int) -> Dict[str, List[Any]]:
+    results: Dict[str, List[Any]] = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    threads = [
+        threading.Thread(target=client_loop, args=(
+            app, f"10.0.0.{i + 1}", ["valid"], deadline, results, lock,
+        ))
+        for i in range(LEGITIMATE_CLIENTS)
+    ] + [
+        threading.Thread(target=client_loop, args=(
+            app, f"10.6.6.{i + 1}", ["wrong password", "unknown user"], deadline, results, lock,
+        ))
+        for i in range(attackers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(name: str, results: Dict[str, List[Any]], seconds: float) -> None:
+    total = sum(len(samples) for samples in results.values())
+    print(f"{name}: {total / seconds:.1f} attempts/s")
+    for kind in ("valid", "wrong password", "unknown user"):
+        samples = sorted(elapsed for elapsed, _ in results.get(kind, []))
+        if not samples:
+            continue
+        codes = Counter(code for _, code in results[kind])
+        p50 = samples[len(samples) // 2]
+        p95 = samples[int(len(samples) * 0.95)]
+        print(
+            f"  {kind:15} {len(samples) / seconds:7.1f}/s  p50 {p50:8.1f} ms  "
+            f"p95 {p95:8.1f} ms  {dict(sorted(codes.items()))}"
+        )
+
+
+def main(seconds: float = 10.0, attackers: int = 4) -> None:
+    from app.main import app
+
+    setup(app)
+    limits = dict(login_limiter.limits)
+    print(
+        f"{USERS} users, {LEGITIMATE_CLIENTS} legitimate clients, {attackers} attackers, "
+        f"{settings.HASH_POOL_WORKERS} hash workers, {seconds:.0f}s per scenario"
+    )
+    for name, enabled in (("limiter off", False), ("limiter on", True)):
+        login_limiter.limits = limits if enabled else {key: 0 for key in limits}
+        login_limiter.failures.clear()
+        report(name, scenario(app, seconds, attackers), seconds)
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if index == 0 else int(arg) for index, arg in enumerate(sys.argv[1:3])))
@@ -0,0 +1,122 @@
+"""
+Item search latency on a large table.
+
+    python -m benchmarks.search [rows] [database_url]
+
+Fills ``items`` with ``rows`` synthetic items (1,000,000 by default) in
+the given database (a temporary SQLite file by default; a PostgreSQL URL
+exercises the GIN indexes), then times /items/search's statements for
+common, rare, multi-word and prefix queries and checks the p95 latency
+against the targets below. An existing table is reused if it is already
+big enough.
+"""
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import Session
+
+from app import models, search
+from app.database import Base
+
+# p95 targets (milliseconds) for one page of 20 results
+TARGETS_MS = {"text": 50.0, "prefix": 20.0}
+
+PAGE_SIZE = 20
+ROUNDS = 50
+BATCH = 10_000
+
+
+def vocabulary(size: int = 5000) -> List[str]:
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+
+
+def fill(engine, rows: int, words: List[str]) -> None:
+    with engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        search.create_search_indexes(connection)
+        existing = connection.scalar(select(func.count()).select_from(models.Item))
+        if existing >= rows:
+            return
+        owner = connection.scalar(select(models.User.id).limit(1))
+        if owner is None:
+            owner = connection.scalar(insert(models.User).values(
+                email="bench@example.com", username="bench", hashed_password="x"
+            ).returning(models.User.id))
+    rng = random.Random(1)
+    # Zipf-like word frequencies, so some terms are common and most are rare
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    for offset in range(existing, rows, BATCH):
+        count = min(BATCH, rows - offset)
+        with engine.begin() as connection:
+            connection.execute(insert(models.Item), [
+                {
+                    "title": " ".join(rng.choices(words, cum_weights=weights, k=3)),
+                    "description": " ".join(rng.choices(words, cum_weights=weights, k=12)),
+                    "owner_id": owner,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for _ in range(count)
+            ])
+        print(f"\rinserted {offset + count:,}/{rows:,}", end="", flush=True)
+    print(f" in {time.perf_counter() - started:.0f}s")
+
+
+def run(engine, queries: List[str], mode: str) -> List[float]:
+    dialect = engine.dialect.name
+    samples = []
+    with Session(engine) as db:
+        for q in queries:
+            stmt = search.search_items_stmt(dialect, q, mode).limit(PAGE_SIZE)
+            start = time.perf_counter()
+            db.scalars(stmt).all()
+            samples.append((time.perf_counter() - start) * 1000)
+            db.expunge_all()
+    return sorted(samples)
+
+
+def main(rows: int = 1_000_000, url: str = "") -> None:
+    if not url:
+        url = "sqlite:///" + os.path.join(tempfile.gettempdir(), "search-benchmark.db")
+    engine = create_engine(url)
+    words = vocabulary()
+    fill(engine, rows, words)
+    rng = random.Random(2)
+    # The ten most frequent synthetic words are in a third or more of all
+    # rows, i.e. stopwords, so "common" starts below them (~2-15% of rows)
+    cases = {
+        "common term": ("text", [rng.choice(words[10:100]) for _ in range(ROUNDS)]),
+        "rare term": ("text", [rng.choice(words[1000:]) for _ in range(ROUNDS)]),
+        "two terms": ("text", [" ".join(rng.sample(words[:200], 2)) for _ in range(ROUNDS)]),
+        "prefix (3 chars)": ("prefix", [rng.choice(words[:500])[:3] for _ in range(ROUNDS)]),
+        "prefix (5 chars)": ("prefix", [rng.choice(words)[:5] for _ in range(ROUNDS)]),
+    }
+    print(f"{rows:,} rows on {engine.dialect.name}, {ROUNDS} queries per case, page of {PAGE_SIZE}")
+    failed = False
+    for name, (mode, queries) in cases.items():
+        run(engine, queries[:3], mode)  # warm up
+        samples = run(engine, queries, mode)
+        p50 = samples[len(samples) // 2]
+        p95 = samples[int(len(samples) * 0.95)]
+        ok = p95 <= TARGETS_MS[mode]
+        failed |= not ok
+        print(
+            f"{name:18} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  "
+            f"target {TARGETS_MS[mode]:.0f} ms  {'ok' if ok else 'MISSED'}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) if index == 0 else arg for index, arg in enumerate(sys.argv[1:3])))
@@ -0,0 +1,85 @@
+"""
+Compare the default list-endpoint serialization with the fast path.
+
+    python -m benchmarks.serialization [rows] [rounds]
+
+"default" loads ORM entities and runs them through FastAPI's
+response_model validation and JSON encoding; "fast" selects plain columns
+and encodes the Core rows with app.serialization (orjson when installed).
+Runs against an in-memory SQLite database, so only the Python side is timed.
+"""
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas, serialization
+from app.database import Base
+
+
+def setup(rows: int) -> Session:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    db.execute(insert(models.User).values(
+        email="bench@example.com", username="bench", hashed_password="x"
+    ))
+    now = datetime.utcnow()
+    db.execute(insert(models.Item), [
+        {"title": f"Item {i}", "description": "x" * 64, "owner_id": 1,
+         "created_at": now, "updated_at": now}
+        for i in range(rows)
+    ])
+    db.commit()
+    return db
+
+
+def default_path(db: Session, adapter: TypeAdapter) -> bytes:
+    db.expunge_all()
+    items = db.scalars(select(models.Item).order_by(models.Item.id)).all()
+    # What FastAPI does with response_model=List[schemas.Item]
+    validated = adapter.validate_python(items, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def fast_path(db: Session) -> bytes:
+    rows = db.execute(
+        select(*serialization.items.columns).order_by(models.Item.id)
+    ).all()
+    return serialization.dumps([row._asdict() for row in rows])
+
+
+def timeit(fn: Callable[[], bytes], rounds: int) -> List[float]:
+    fn()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+def main(rows: int = 100, rounds: int = 200) -> None:
+    db = setup(rows)
+    adapter = TypeAdapter(List[schemas.Item])
+    results = {
+        "default": timeit(lambda: default_path(db, adapter), rounds),
+        "fast": timeit(lambda: fast_path(db), rounds),
+    }
+    print(f"{rows} rows, {rounds} rounds, orjson={'yes' if serialization.orjson else 'no'}")
+    for name, samples in results.items():
+        median = samples[len(samples) // 2] * 1000
+        p95 = samples[int(len(samples) * 0.95)] * 1000
+        print(f"{name:8} median {median:7.3f} ms  p95 {p95:7.3f} ms")
+    speedup = results["default"][rounds // 2] / results["fast"][rounds // 2]
+    print(f"fast path is {speedup:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,122 @@
+"""
+Cold-start budget: how long a fresh worker takes to import the app and run
+its startup.
+
+    python -m benchmarks.startup [budget_ms] [runs]
+
+Imports ``app.main`` in ``runs`` fresh interpreters (5 by default) and
+reports the median import and startup (lifespan) times, the slowest
+imports grouped by top-level package, and any rarely used module that got
+imported at startup although it should only be loaded on use. Exits with
+status 1 when the median import + startup time exceeds ``budget_ms``
+(BUDGET_MS by default) or a lazy module was imported. Settings come from
+the environment as usual; without DATABASE_URL a temporary SQLite file is
+used.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+BUDGET_MS = 1500.0
+TOP = 12
+
+
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(startup())
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (done - imported) * 1000,
+    "modules": sorted(sys.modules),
+}))
+"""
+
+
+def lazy_modules() -> List[str]:
+    """
+    Modules that must only be imported once their feature is used.
+    """
+    from app.config import settings
+
+    modules = ["app.hash_calibration", "app.manage", "gunicorn"]
+    if settings.CACHE_BACKEND != "redis":
+        modules.append("redis")
+    for name in ("items", "users"):
+        if name not in settings.ASYNC_ROUTERS:
+            modules.append(f"app.api.endpoints.{name}_async")
+    return modules
+
+
+def probe(env: Dict[str, str]) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(env: Dict[str, str]) -> List[Tuple[str, int, int]]:
+    """
+    (module, self µs, cumulative µs) for every module ``app.main`` imports,
+    from ``python -X importtime``.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(own), int(cumulative)))
+    return rows
+
+
+def main(budget_ms: float = BUDGET_MS, runs: int = 5) -> None:
+    env = dict(os.environ)
+    env.setdefault(
+        "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "startup-benchmark.db")
+    )
+    # Site-wide bytecode is assumed to be compiled already, as in a deployment
+    probe(env)
+    samples = [probe(env) for _ in range(runs)]
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    startup_ms = statistics.median(sample["startup_ms"] for sample in samples)
+
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, own, _ in import_profile(env):
+        by_package[name.split(".")[0]] += own
+    print(f"import app.main  {import_ms:8.1f} ms   (median of {runs} fresh interpreters)")
+    print(f"startup          {startup_ms:8.1f} ms")
+    print("slowest packages (self time, under -X importtime):")
+    for package, own in sorted(by_package.items(), key=lambda row: -row[1])[:TOP]:
+        print(f"  {package:28} {own / 1000:8.1f} ms")
+
+    failed = False
+    eager = [module for module in lazy_modules() if module in samples[0]["modules"]]
+    for module in eager:
+        print(f"imported at startup although lazy: {module}")
+        failed = True
+    total = import_ms + startup_ms
+    ok = total <= budget_ms
+    failed |= not ok
+    print(f"total {total:.1f} ms, budget {budget_ms:.0f} ms  {'ok' if ok else 'MISSED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(*(float(arg) if index == 0 else int(arg) for index, arg in enumerate(sys.argv[1:3])))
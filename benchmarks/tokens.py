@@ -0,0 +1,80 @@
+"""
+Compare python-jose with app.tokens for issuing and verifying access tokens.
+
+    python -m benchmarks.tokens [rounds]
+
+"jose" is what create_access_token and decode_access_token used to do:
+``jwt.encode`` of claims with a datetime ``exp`` and ``jwt.decode`` with
+its full claim validation. "codec" is app.tokens with an HS256 key, and
+with freshly generated ES256 and EdDSA keys (``cryptography`` when it is
+installed, else pure-Python ``ecdsa``).
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from jose import jwt
+
+from app import tokens
+from app.tokens import TokenCodec, generate_private_key, load_key
+
+SECRET = "benchmark-secret-key-0123456789abcdef"
+CLAIMS = {"is_active": True, "is_superuser": False, "ver": 0}
+
+
+def timeit(fn: Callable[[], Any], rounds: int) -> List[float]:
+    fn()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)
+
+
+def jose_encode() -> str:
+    expire = datetime.utcnow() + timedelta(minutes=60)
+    return jwt.encode({"exp": expire, "sub": "42", **CLAIMS}, SECRET, algorithm="HS256")
+
+
+def codec_encode(codec: TokenCodec) -> Callable[[], str]:
+    def encode() -> str:
+        return codec.encode({"exp": int(time.time()) + 3600, "sub": "42", **CLAIMS})
+
+    return encode
+
+
+def main(rounds: int = 20000) -> None:
+    codecs: Dict[str, TokenCodec] = {"HS256": TokenCodec({"k": load_key(SECRET)}, "k")}
+    for alg in ("ES256", "EdDSA"):
+        codecs[alg] = TokenCodec({"k": load_key(generate_private_key(alg))}, "k")
+
+    token = jose_encode()
+    cases: Dict[str, Callable[[], Any]] = {
+        "jose HS256 encode": jose_encode,
+        "jose HS256 decode": lambda: jwt.decode(token, SECRET, algorithms=["HS256"]),
+    }
+    for alg, codec in codecs.items():
+        encoded = codec.encode({"exp": int(time.time()) + 3600, "sub": "42", **CLAIMS})
+        cases[f"codec {alg} encode"] = codec_encode(codec)
+        cases[f"codec {alg} decode"] = lambda codec=codec, encoded=encoded: codec.decode(encoded)
+
+    backend = "cryptography" if tokens.pem is not None else "ecdsa"
+    print(f"{rounds} rounds (asymmetric: {rounds // 100}), ES256/EdDSA backend: {backend}")
+    results = {}
+    for name, fn in cases.items():
+        # Pure-Python ECDSA takes milliseconds per token
+        n = rounds if "HS256" in name else max(rounds // 100, 10)
+        results[name] = samples = timeit(fn, n)
+        median = samples[len(samples) // 2] * 1e6
+        p95 = samples[int(len(samples) * 0.95)] * 1e6
+        print(f"{name:20} median {median:9.1f} us  p95 {p95:9.1f} us")
+    for op in ("encode", "decode"):
+        jose = results[f"jose HS256 {op}"]
+        codec = results[f"codec HS256 {op}"]
+        print(f"HS256 {op} speedup (median): {jose[len(jose) // 2] / codec[len(codec) // 2]:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,11 @@
+# Loaded by gunicorn from the working directory: `gunicorn app.main:app`
+# (or main:app) runs with the SERVER_* settings, see app/server.py
+import sys
+
+from app.server import gunicorn_options
+
+globals().update(gunicorn_options())
+
+# A preloaded app lives in the master, which --reload does not restart
+if "--reload" in sys.argv:
+    preload_app = False
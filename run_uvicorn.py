@@ -1,4 +1,5 @@
-import uvicorn
+from app.server import main
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Development: one uvicorn process restarting on code changes
+    main(["--reload"])
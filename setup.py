@@ -9,16 +9,18 @@ setup(
         "fastapi>=0.109.2",
         "uvicorn>=0.27.1",
         "pydantic>=2.5.2",
-        "pydantic-settings>=2.1.0",
+        "pydantic-settings>=2.7.0",
         "python-multipart>=0.0.9",
         "email-validator>=2.1.0.post1",
+        "orjson>=3.9.0",
 
         # Database support
-        "sqlalchemy>=2.0.29",
+        "sqlalchemy[asyncio]>=2.0.29",
         "psycopg2-binary>=2.9.9",
+        "asyncpg>=0.29.0",
 
         # Authentication
-        "python-jose>=3.3.0",
+        "ecdsa>=0.18",
         "passlib>=1.7.4",
 
         # Web server
@@ -28,5 +30,11 @@ setup(
         "flask>=2.3.3",
         "flask-sqlalchemy>=3.1.1",
     ],
+    extras_require={
+        # Async routers (ASYNC_ROUTERS) on a SQLite DATABASE_URL
+        "sqlite": ["aiosqlite>=0.20.0"],
+        # benchmarks.tokens compares app.tokens with python-jose
+        "bench": ["python-jose>=3.3.0"],
+    },
     python_requires=">=3.9",
 )
\ No newline at end of file